@@ -12,12 +12,21 @@
 #         BOTTOM row of the w-ocean corresponds to LEFT  multiplication
 
 
-import turtle # for drawing w-oceans
-from tkinter import * # for saving w-oceans to postscript
-from itertools import chain, combinations # for powerset function
+from itertools import chain, combinations, product, permutations # for powerset function
 import time # for test functions
 import random
 import math
+import threading # for guarding the a-sequence and b-sequence caches
+import functools # for caching recurrence coefficients
+from array import array # for compact storage of permutations
+import os
+from collections import Counter # for distributions of ranks and sizes
+import heapq # for merging sorted runs of intervals
+import pickle
+import tempfile
+import struct # for binary catalogues of intervals
+import mmap
+import bisect
 
 
 ####################
@@ -25,14 +34,11 @@ import math
 ####################
 
 
-# S_N, determines which symmetric group we will be working in
-# (i.e. the size of the permutations)
-N = 5
-
-print('Currently N = ' + str(N) + '.')
 ##print('Remember to call init_turtle() before calling drawOcean(w,save) or draw_S(n).')
 
 # NOTE: Permutations are written in one-line notation and are represented as tuples
+# NOTE: No function reads a global size; the symmetric group S_n is determined by
+#       len(w) for a permutation w, or passed explicitly as n (see SymmetricGroup)
 
 # examples for testing
 e  = (1,2,3,4,5)
@@ -51,15 +57,10 @@ w3 = (7,1,2,3,5,4,6)
 # 5 and 6 represent 2' and 2'' respectively
 A_initial = [[1,2,6,20,66], [1,3,9,28,89], [1,4,12,36,112], [1,4,14,46,148], [1,4,16,56,184], [1,3,11,37,119], [1,4,12,37,118]]
 
-# Cache for the a-sequences
+# Cache for the a-sequences, grown on demand by a(k,m)
 # A[k][m] returns the mth term of the sequence a^k
 # 5 and 6 represent 2' and 2'' respectively
-A = [[0 for x in range(10000)] for y in range(7)]
-
-# Initializing the initial terms for the a-sequences
-for i in range(7):
-    for j in range(5):
-        A[i][j] = A_initial[i][j]
+A = [list(x) for x in A_initial]
 
 # Maps the boundary apparatus (tuple) (I,J,K,L) to the corresponding b-sequence (0 - 26)
 bd_dict = {(0,0,0,0) : 0,
@@ -90,9 +91,6 @@ bd_dict = {(0,0,0,0) : 0,
            (10,10,10,1) : 25, (10,10,1,10) : 25, (10,1,10,10) : 25, (1,10,10,10) : 25,
            (10,10,10,10) : 26}
 
-# Cache for the b-equences, B[k][m] returns the mth term of the sequence b^k
-B = [[0 for x in range(10000)] for y in range(27)]
-
 # Initial terms for the b-sequences
 B_initial = [[1,2,6,20,66,214], [1,3,9,28,89,285,914], [1,3,11,37,119,380,1216], [1,4,12,36,112,356,1140], [1,4,12,37,118,379,1216],
              [1,4,14,46,148,474,1518], [1,4,16,56,184,592,1896], [2,5,15,48,155,499,1602], [2,6,20,65,208,665,2130], [2,7,21,64,201,641,2054],
@@ -101,10 +99,21 @@ B_initial = [[1,2,6,20,66,214], [1,3,9,28,89,285,914], [1,3,11,37,119,380,1216],
              [4,15,47,147,467,1494,4788], [4,15,55,185,599,1920,6148], [4,16,56,184,592,1896,6072], [4,16,56,185,598,1919,6148], [8,26,82,260,830,2658,8520],
              [8,30,102,332,1066,3414,10936], [16,56,184,592,1896,6072,19456]]
 
-# Initializing the initial terms for the b-sequences
-for i in range(27):
-    for j in range(6):
-        B[i][j] = B_initial[i][j]
+# Cache for the b-sequences, grown on demand by b(k,m)
+# B[k][m] returns the mth term of the sequence b^k
+B = [list(x) for x in B_initial]
+
+# Guards the growth of A and B, so that threads never append out of order
+sequence_lock = threading.Lock()
+
+# Every a-sequence and b-sequence satisfies the recurrence
+# x_m = 6x_(m-1) - 13x_(m-2) + 16x_(m-3) - 11x_(m-4) + 4x_(m-5)
+# recurrence[j] is the coefficient of x_(m-5+j)
+recurrence = (4, -11, 16, -13, 6)
+
+# A and B are only grown term by term up to this many terms past their end;
+# terms further out are computed directly by term(initial,m)
+SEQUENCE_STEP = 1000
 
 
 ###################
@@ -112,28 +121,36 @@ for i in range(27):
 ###################
 
 
+# The turtle module, imported by init_turtle() the first time a w-ocean is drawn
+# (importing it opens a Tk window, which is slow and fails on headless machines)
+turtle = None
+
+# Returns the numpy module, or None if NumPy is not installed
+# NumPy is optional, for batch computations over many permutations, and is only
+# imported the first time one of those is done, so that importing PDC stays cheap
+@functools.lru_cache(maxsize=None)
+def get_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
 # Initializing the turtle module
 def init_turtle():
+    global turtle
+    import turtle
     turtle.setup(width=1200, height=600)
     turtle.delay(0)
     turtle.speed(0)
 
-init_turtle()
+# Returns the identity permutation of S_n
+def identity(n):
+    return tuple(range(1,n + 1))
 
-def set_N(n):
-    global N
-    N = n
-    global w0
-    x = [0]*n
-    for i in range(n):
-        x[i] = n - i
-    w0 = tuple(x)
-    global e
-    y = [0]*n
-    for i in range(n):
-        y[i] = i + 1
-    e = tuple(y)
-    print('Currently N = ' + str(n) + '.')
+# Returns the longest permutation w_0 of S_n
+def longest(n):
+    return tuple(range(n,0,-1))
 
 # Returns the powerset of the given iterable structure, as a set of tuples
 def powerset(X):
@@ -141,35 +158,168 @@ def powerset(X):
 
 # Returns the inverse of the given permutation
 def inverse(w):
-    z = [0]*N
-    for i in range(N):
-        z[i] = w.index(i + 1) + 1
+    n = len(w)
+    z = [0]*n
+    for i in range(n):
+        z[w[i] - 1] = i + 1
     return tuple(z)
 
 # Multiplies the given permutations in the order in which they are given
 # Returns the product as a tuple
 def mult(w,s):
-    z = [0]*N
-    for i in range(N):
+    n = len(w)
+    z = [0]*n
+    for i in range(n):
         z[i] = w[s[i] - 1]
     return tuple(z)
 
 # Returns the length (number of inversions) of the given permutation
+# Counts, from right to left, the smaller values already seen, with a Fenwick tree,
+# in O(n log n)
 def length(w):
+    n = len(w)
+    tree = [0]*(n + 1)
     result = 0
-    for i in range(N):
-        for j in range(i,N):
-            if w[j] < w[i]:
-                result += 1
+    for i in range(n - 1,-1,-1):
+        j = w[i] - 1
+        while j > 0:
+            result += tree[j]
+            j -= j & -j
+        j = w[i]
+        while j <= n:
+            tree[j] += 1
+            j += j & -j
     return result
 
-# Returns the adjacent transposition s_k as a tuple
-def s(k):
-    z = list(range(1,N + 1))
+# Returns the lengths of the given permutations, which may be a list of
+# permutations, a PermArray or an (m, n) array
+# With NumPy, this is computed for all m permutations at once with n - 1
+# vectorised comparisons and returned as an array; without it, as a list
+# A single permutation is not a valid input (use length for that)
+def lengths(perms):
+    numpy = get_numpy()
+    if numpy is None:
+        return [length(w) for w in perms]
+    X = as_array(perms)
+    if X.ndim != 2:
+        if X.size == 0:
+            return numpy.zeros(0,dtype=numpy.int64)
+        raise ValueError('expected permutations as an (m, n) array, not an array of shape ' + str(X.shape))
+    result = numpy.zeros(len(X),dtype=numpy.int64)
+    for i in range(X.shape[1] - 1):
+        result += (X[:,i + 1:] < X[:,i:i + 1]).sum(axis=1)
+    return result
+
+# Returns the given permutations (a list of permutations, a PermArray or an array)
+# as an (m, n) NumPy array, without copying a PermArray
+def as_array(perms):
+    numpy = get_numpy()
+    if isinstance(perms,PermArray):
+        return numpy.frombuffer(perms.data,dtype=numpy.uint8).reshape(-1,perms.n)
+    return numpy.asarray(perms)
+
+# Returns the adjacent transposition s_k in S_n as a tuple
+def s(k,n):
+    z = list(range(1,n + 1))
     z[k - 1] = k + 1
     z[k] = k
     return tuple(z)
 
+# A symmetric group S_n, carrying its own identity e, longest element w0,
+# simple generators and caches, so that computations in different symmetric
+# groups (or in different threads/processes) never share any state
+class SymmetricGroup:
+    def __init__(self,n):
+        self.n = n
+        self.e = identity(n)
+        self.w0 = longest(n)
+        self.generators = tuple(s(i,n) for i in range(1,n))
+        self.subgroups = dict() # cache for parabolic subgroups, keyed by the mask of I
+
+    def __repr__(self):
+        return 'S_' + str(self.n)
+
+    def __len__(self):
+        return math.factorial(self.n)
+
+    # Returns the adjacent transposition s_k
+    def s(self,k):
+        return self.generators[k - 1]
+
+    # Returns w0*w*w0
+    def conjugate(self,w):
+        return mult(self.w0,mult(w,self.w0))
+
+    # Returns the parabolic subgroup W_I as a ParabolicSubgroup
+    def parabolic_subgroup(self,I):
+        key = to_mask(I)
+        if key not in self.subgroups:
+            self.subgroups[key] = ParabolicSubgroup(key,self.n)
+        return self.subgroups[key]
+
+    # Yields the elements of S_n with rank in [start, stop), in lexicographic order
+    def elements(self,start=0,stop=None):
+        return S_range(self.n,start,stop)
+
+
+########################
+# SUBSETS AS BITMASKS #
+########################
+
+
+# A subset X of {1, ..., n - 1} (e.g. a set I of simple reflections, or an ascent set)
+# can also be represented as the integer mask with bit i set iff i is in X
+# Functions taking sets I, J of simple reflections also accept masks
+
+# Returns the mask of the given set (or the mask itself, if given a mask)
+def to_mask(X):
+    if isinstance(X,int):
+        return X
+    result = 0
+    for i in X:
+        result |= 1 << i
+    return result
+
+# Returns the set {i : bit i of m is set}
+def to_set(m):
+    result = set()
+    while m:
+        low = m & -m
+        result.add(low.bit_length() - 1)
+        m ^= low
+    return result
+
+# Returns the sorted tuple of indices of the bits set in m, negated if bottom == True
+def to_indices(m,bottom=False):
+    digits = bin(m)[:1:-1] # binary digits of m, least significant first
+    result = [i for i in range(len(digits)) if digits[i] == '1']
+    if bottom:
+        result = [-1*x for x in reversed(result)]
+    return tuple(result)
+
+# Yields every submask of m (i.e. the masks of all subsets of the set with mask m)
+# by counting down through the submasks, without building the powerset
+def submasks(m):
+    x = m
+    while True:
+        yield x
+        if x == 0:
+            return
+        x = (x - 1) & m
+
+# Returns the list of blocks (a,b) of the mask m, i.e. the maximal runs of
+# consecutive indices a, a + 1, ..., b in the set with mask m
+# The block (a,b) of a set I generates the symmetric group on {a, ..., b + 1} in W_I
+def blocks(m):
+    result = []
+    while m:
+        a = (m & -m).bit_length() - 1
+        x = m >> a
+        size = (~x & (x + 1)).bit_length() - 1 # number of trailing ones of x
+        result.append((a,a + size - 1))
+        m &= ~(((1 << size) - 1) << a)
+    return result
+
 
 ########################
 # ASCENTS AND DESCENTS #
@@ -202,35 +352,33 @@ def isRightDescent(w,k):
 
 # Returns the left ascent set of the given permutation
 def leftAscentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isLeftAscent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).leftAscents)
 
 # Returns the right ascent set of the given permutation
 def rightAscentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isRightAscent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).rightAscents)
 
 # Returns the left descent set of the given permutation
 def leftDescentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isLeftDescent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).leftDescents)
 
 # Returns the right descent set of the given permutation
 def rightDescentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isRightDescent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).rightDescents)
+
+# Returns the pair of masks (left descents, right descents) of w, in O(n)
+def descentMasks(w):
+    n = len(w)
+    inv = [0]*(n + 1)
+    for i in range(n):
+        inv[w[i]] = i
+    left = right = 0
+    for k in range(1,n):
+        if w[k - 1] > w[k]:
+            right |= 1 << k
+        if inv[k] > inv[k + 1]:
+            left |= 1 << k
+    return (left,right)
 
 # Returns whether the adjacent transposition s_k is a small left ascent of w
 def isSmallLeftAscent(w,k):
@@ -250,66 +398,96 @@ def isLargeRightAscent(w,k):
 
 # Returns the small left ascent set of w
 def smallLeftAscentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isSmallLeftAscent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).smallLeft)
 
 # Returns the small right ascent set of w
 def smallRightAscentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isSmallRightAscent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).smallRight)
 
 # Returns the large left ascent set of w
 def largeLeftAscentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isLargeLeftAscent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).largeLeft)
 
 # Returns the large right ascent set of w
 def largeRightAscentSet(w):
-    result = set()
-    for i in range(N - 1):
-        if isLargeRightAscent(w,i + 1):
-            result.add(i + 1)
-    return result
+    return to_set(descriptor(w).largeRight)
 
 
 ################################
 # MINIMAL AND MAXIMAL ELEMENTS #
 ################################
 
+# W_J permutes the positions within each block of J, and W_I permutes the values
+# within each block of I, where the block (a,b) of a set covers {a, ..., b + 1}
+# So the minimal (maximal) element of w*W_J has the entries in each block of
+# positions in increasing (decreasing) order, and the minimal (maximal) element of
+# W_I*w has the values in each block of values in increasing (decreasing) order
+# of position. These are computed in O(n) by the functions below.
+
+# Returns the block layout of the set (or mask) X in S_n, as a pair of lists
+# (start, end) where start[p] is the first index of the block covering p,
+# or 0 if p is in no block, and end[a] is the last index of the block starting at a
+def block_layout(X,n):
+    start = [0]*(n + 1)
+    end = [0]*(n + 1)
+    for (a,b) in blocks(to_mask(X)):
+        for p in range(a,b + 2):
+            start[p] = a
+        end[a] = b + 1
+    return (start,end)
+
+# Sorts the entries of w within each block of positions of the given layout,
+# in decreasing order if reverse == True
+def sortRight(w,layout,reverse):
+    start, end = layout
+    n = len(w)
+    z = list(w)
+    # fill[a] is the next position to fill in the block starting at a
+    if reverse:
+        fill = list(end)
+        step = -1
+    else:
+        fill = list(range(n + 1))
+        step = 1
+    inv = [0]*(n + 1)
+    for i in range(n):
+        inv[w[i]] = i + 1
+    # visiting the values in increasing order
+    for v in range(1,n + 1):
+        a = start[inv[v]]
+        if a:
+            z[fill[a] - 1] = v
+            fill[a] += step
+    return tuple(z)
+
+# Sorts the positions of the values of w within each block of values of the given
+# layout, so that they appear in decreasing order if reverse == True
+def sortLeft(w,layout,reverse):
+    start, end = layout
+    n = len(w)
+    z = list(w)
+    # fill[a] is the next value to place from the block starting at a
+    if reverse:
+        fill = list(end)
+        step = -1
+    else:
+        fill = list(range(n + 1))
+        step = 1
+    # visiting the positions from left to right
+    for i in range(n):
+        a = start[w[i]]
+        if a:
+            z[i] = fill[a]
+            fill[a] += step
+    return tuple(z)
+
 # Returns the minimal element in the right coset w*W_J
 def minimalRight(w,J):
-    aux = list.copy(list(w)) # auxiliary storage, as to not modify w
-    z = list.copy(list(w))
-    for i in range(len(J)):
-        for j in J:
-            if z[j - 1] > z[j]:
-                z[j - 1] = aux[j]
-                z[j] = aux[j - 1]
-                aux[j - 1] = z[j - 1]
-                aux[j] = z[j]
-    return tuple(z)
+    return sortRight(w,block_layout(J,len(w)),False)
 
 # Returns the minimal element in the left coset W_I*w
 def minimalLeft(w,I):
-    aux = list.copy(list(w)) # auxiliary storage, as to not modify w
-    z = list.copy(list(w))
-    for j in range(len(I)):
-        for i in I:
-            if aux.index(i) > aux.index(i + 1):
-                z[aux.index(i)] = i + 1
-                z[aux.index(i + 1)] = i
-                aux[aux.index(i)] = z[aux.index(i)]
-                aux[aux.index(i + 1)] = z[aux.index(i + 1)]
-    return tuple(z)
+    return sortLeft(w,block_layout(I,len(w)),False)
 
 # Returns the minimal element in the parabolic double coset W_I*w*W_J
 def minimal(I,w,J):
@@ -317,34 +495,39 @@ def minimal(I,w,J):
 
 # Returns the maximal element in the right coset w*W_J
 def maximalRight(w,J):
-    aux = list.copy(list(w)) # auxiliary storage, as to not modify w
-    z = list.copy(list(w))
-    for i in range(len(J)):
-        for j in J:
-            if z[j - 1] < z[j]:
-                z[j - 1] = aux[j]
-                z[j] = aux[j - 1]
-                aux[j - 1] = z[j - 1]
-                aux[j] = z[j]
-    return tuple(z)
+    return sortRight(w,block_layout(J,len(w)),True)
 
 # Returns the maximal element in the left coset W_I*w
 def maximalLeft(w,I):
-    aux = list.copy(list(w)) # auxiliary storage, as to not modify w
-    z = list.copy(list(w))
-    for j in range(len(I)):
-        for i in I:
-            if aux.index(i + 1) > aux.index(i):
-                z[aux.index(i + 1)] = i
-                z[aux.index(i)] = i + 1
-                aux[aux.index(i + 1)] = z[aux.index(i + 1)]
-                aux[aux.index(i)] = z[aux.index(i)]
-    return tuple(z)
+    return sortLeft(w,block_layout(I,len(w)),True)
 
 # Returns the maximal element in the double coset W_I*w*W_J
 def maximal(I,w,J):
     return maximalRight(maximalLeft(w,I), J)
 
+# Batch forms of minimal and maximal: given a list of triples (I,w,J), returns the
+# list of minimal (maximal) elements of the W_I*w*W_J, in the same order
+# The block layout of each distinct I and J is only computed once
+def minimal_batch(triples):
+    return extremal_batch(triples,False)
+
+def maximal_batch(triples):
+    return extremal_batch(triples,True)
+
+def extremal_batch(triples,reverse):
+    layouts = dict()
+    result = []
+    for (I,w,J) in triples:
+        n = len(w)
+        I = (to_mask(I),n)
+        J = (to_mask(J),n)
+        if I not in layouts:
+            layouts[I] = block_layout(I[0],n)
+        if J not in layouts:
+            layouts[J] = block_layout(J[0],n)
+        result.append(sortRight(sortLeft(w,layouts[I],reverse),layouts[J],reverse))
+    return result
+
 # Returns whether W_I*w*W_J = Z_K*z*Z_L
 def equals(I,w,J,K,z,L):
     return (minimal(I,w,J) == minimal(K,z,L)) and (maximal(I,w,J) == maximal(K,z,L))
@@ -374,14 +557,64 @@ def bd_a(i,j,k,l):
         else: # (i == l)
             return 6
 
+# Returns the polynomial p*q mod t^5 - 6t^4 + 13t^3 - 16t^2 + 11t - 4, where
+# polynomials are lists of coefficients, constant term first
+def mult_mod(p,q):
+    r = [0]*9
+    for i in range(5):
+        if p[i]:
+            for j in range(5):
+                r[i + j] += p[i]*q[j]
+    # reducing with t^5 = 6t^4 - 13t^3 + 16t^2 - 11t + 4
+    for d in range(8,4,-1):
+        if r[d]:
+            for j in range(5):
+                r[d - 5 + j] += r[d]*recurrence[j]
+    return r[:5]
+
+# Returns the coefficients (c_0, ..., c_4) of t^m mod the characteristic polynomial
+# of the recurrence, so that x_m = c_0*x_0 + ... + c_4*x_4 for every a-sequence
+# and b-sequence (Kitamasa's method), using O(log m) polynomial multiplications
+@functools.lru_cache(maxsize=1024)
+def coefficients(m):
+    result = [1,0,0,0,0]
+    power = [0,1,0,0,0] # t^(2^i)
+    while m > 0:
+        if m & 1:
+            result = mult_mod(result,power)
+        power = mult_mod(power,power)
+        m >>= 1
+    return tuple(result)
+
+# Returns the mth term of the sequence satisfying the recurrence with the given
+# initial terms, exactly and in O(log m)
+def term(initial,m):
+    if m < 5:
+        return initial[m]
+    result = 0
+    for (x,y) in zip(coefficients(m),initial):
+        result += x*y
+    return result
+
+# Grows the cached sequence x using the recurrence until it has its mth term
+def extend(x,m):
+    with sequence_lock:
+        while len(x) <= m:
+            x.append(6*x[-1] - 13*x[-2] + 16*x[-3] - 11*x[-4] + 4*x[-5])
+
+# Returns the mth term of the cached sequence x with the given initial terms
+# Grows the cache iteratively when m is not far past its end
+def cached_term(x,initial,m):
+    if m < len(x):
+        return x[m]
+    if m - len(x) > SEQUENCE_STEP:
+        return term(initial,m)
+    extend(x,m)
+    return x[m]
+
 # Returns the mth term of the sequence a^k using the recurence relation
 def a(k,m):
-    if A[k][m] != 0:
-        return A[k][m]
-    else:
-        result = 6*a(k,m-1) - 13*a(k,m-2) + 16*a(k,m-3) - 11*a(k,m-4) + 4*a(k,m-5)
-        A[k][m] = result
-        return result
+    return cached_term(A[k],A_initial[k],m)
 
 # Returns the mth term of the a-sequence for the boundary apparatus (i,j,k,l)
 def a2(i,j,k,l,m):
@@ -395,12 +628,25 @@ def print_a(k,n):
 
 # Returns b^k_m, the mth term of the k^th b-sequence
 def b(k,m):
-    if B[k][m] != 0:
-        return B[k][m]
-    else:
-        result = 6*b(k,m-1) - 13*b(k,m-2) + 16*b(k,m-3) - 11*b(k,m-4) + 4*b(k,m-5)
-        B[k][m] = result
-        return result
+    x = B[k]
+    if m < len(x):
+        return x[m]
+    return cached_term(x,B_initial[k],m)
+
+# Returns the first M terms of all 7 a-sequences, as a table whose row k
+# is the list of terms a^k_0, ..., a^k_(M-1)
+def a_table(M):
+    for k in range(7):
+        extend(A[k],M - 1)
+    return [A[k][:M] for k in range(7)]
+
+# Returns the first M terms of all 27 b-sequences, as a table whose row k
+# is the list of terms b^k_0, ..., b^k_(M-1)
+# (e.g. to look up b(k,m) for many k and m without function calls)
+def b_table(M):
+    for k in range(27):
+        extend(B[k],M - 1)
+    return [B[k][:M] for k in range(27)]
 
 # Prints the first n terms of the sequence b^k
 def print_b(k,n):
@@ -412,90 +658,531 @@ def print_b(k,n):
 # PARABOLIC SUBGROUPS AND COSETS #
 ##################################
 
-# Returns the subgroup generated by the elements in G
-def subgroup(G):
-    e = tuple(range(1,N+1))
-    result = set()
-    aux = set()
-    result.add(e)
-    aux.add(e)
-    for g in G:
-        result.add(g)
-        aux.add(g)
-    # counters
-    x = -1
-    y = 0
-    # terminates when no new permutations are obtained from
-    # (pairwise) multiplying all elements
-    while x < y:
-        x = len(result)
-        for w in result:
-            for z in result:
-                aux.add(mult(w,z))
-        result = set.copy(aux)
-        y = len(result)
-    return result
+# The parabolic subgroup W_I of S_n, generated by the s_i for i in I
+# W_I is the product of the symmetric groups on the blocks of I, i.e. the
+# permutations sending each block {a, ..., b + 1} of positions to itself and fixing
+# every other position. Its elements are generated lazily, by a nested walk over
+# the permutations of each block (a fresh permutations() generator per block at
+# each level), so only the current permutation of each block is held in memory
+class ParabolicSubgroup:
+    def __init__(self,I,n):
+        self.n = n
+        self.mask = to_mask(I)
+        self.blocks = blocks(self.mask)
+        self.start = block_layout(self.mask,n)[0]
+        self.order = card_W(self.mask)
+
+    def __repr__(self):
+        return 'W_' + str(to_indices(self.mask)) + ' in S_' + str(self.n)
+
+    # Returns |W_I|, in O(1)
+    def __len__(self):
+        return self.order
+
+    # Returns whether w is in W_I, in O(n)
+    def __contains__(self,w):
+        if len(w) != self.n:
+            return False
+        start = self.start
+        for i in range(1,self.n + 1):
+            a = start[i]
+            if a != start[w[i - 1]] or (a == 0 and w[i - 1] != i):
+                return False
+        return True
+
+    # Yields the elements of W_I
+    def __iter__(self):
+        return self.walk(list(range(1,self.n + 1)),0)
+
+    # Yields z with its blocks i, i + 1, ... permuted in every way
+    def walk(self,z,i):
+        if i == len(self.blocks):
+            yield tuple(z)
+            return
+        (a,b) = self.blocks[i]
+        for y in permutations(range(a,b + 2)):
+            z[a - 1:b + 1] = y
+            yield from self.walk(z,i + 1)
+
+# The subgroup of S_n generated by the permutations in G, stored as a stabiliser
+# chain built with the Schreier-Sims algorithm
+# Level i of the chain has a base point base[i] and the group G_i generated by
+# strong[i], where G_0 is the whole group and G_(i + 1) is the stabiliser of
+# base[i] in G_i. transversals[i] maps each point x in the orbit of base[i] under
+# G_i to an element u of G_i with u(base[i]) = x. So every element of the group is
+# uniquely a product u_0*u_1*...*u_(k-1) of transversal elements, which gives its
+# order, membership tests and random elements without listing the group
+class PermutationGroup:
+    def __init__(self,G,n):
+        self.n = n
+        self.e = identity(n)
+        self.base = []
+        self.strong = []
+        self.transversals = []
+        for g in G:
+            (h,i) = self.sift(tuple(g))
+            if h != self.e:
+                self.add(h,0)
+        self.order = 1
+        for T in self.transversals:
+            self.order *= len(T)
+
+    def __repr__(self):
+        return 'group of order ' + str(self.order) + ' in S_' + str(self.n)
+
+    # Returns the order of the group
+    def __len__(self):
+        return self.order
+
+    # Returns whether w is in the group, in O(n^2)
+    def __contains__(self,w):
+        return len(w) == self.n and self.sift(tuple(w))[0] == self.e
+
+    # Yields the elements of the group, one product of transversal elements at a time
+    def __iter__(self):
+        for x in product(*[T.values() for T in self.transversals]):
+            z = self.e
+            for u in x:
+                z = mult(z,u)
+            yield z
+
+    # Returns a uniformly random element of the group
+    def random_element(self):
+        z = self.e
+        for T in self.transversals:
+            z = mult(z,random.choice(list(T.values())))
+        return z
+
+    # Strips w through the chain, starting at level i: at each level, w is
+    # multiplied by the inverse of the transversal element for w(base point)
+    # Returns (h,j) where h is what remains of w and j is the level where the
+    # orbit did not contain the image of the base point (or the number of levels)
+    def sift(self,w,i=0):
+        while i < len(self.base):
+            x = w[self.base[i] - 1]
+            T = self.transversals[i]
+            if x not in T:
+                return (w,i)
+            w = mult(inverse(T[x]),w)
+            i += 1
+        return (w,i)
+
+    # Adds h, which fixes base[0], ..., base[i - 1], to the generators of level i,
+    # extends the orbit of base[i], and adds every Schreier generator that does
+    # not sift through the rest of the chain to level i + 1
+    def add(self,h,i):
+        if i == len(self.base):
+            b = 1
+            while h[b - 1] == b:
+                b += 1
+            self.base.append(b)
+            self.strong.append([])
+            self.transversals.append({b: self.e})
+        gens = self.strong[i]
+        T = self.transversals[i]
+        gens.append(h)
+        # pairs (x,g) of an orbit point and a generator still to be checked
+        pairs = [(x,h) for x in T]
+        while pairs:
+            (x,g) = pairs.pop()
+            y = g[x - 1]
+            u = mult(g,T[x])
+            if y not in T:
+                T[y] = u
+                pairs.extend((y,f) for f in gens)
+            else:
+                (z,j) = self.sift(mult(inverse(T[y]),u),i + 1)
+                if z != self.e:
+                    self.add(z,i + 1)
 
-# Returns the parabolic subgroup W_I as a set
-def parabolic_subgroup(I):
-    e = tuple(range(1,N+1))
-    result = set()
-    aux = set()
-    result.add(e)
-    aux.add(e)
-    for i in I:
-        result.add(s(i))
-        aux.add(s(i))
-    # counters
-    x = -1
-    y = 0
-    # terminates when no new permutations are obtained from
-    # (pairwise) multiplying all elements
-    while x < y:
-        x = len(result)
-        for w in result:
-            for z in result:
-                aux.add(mult(w,z))
-        result = set.copy(aux)
-        y = len(result)
-    return result
+# Returns the subgroup of S_n generated by the elements in G, as a set
+# (for small groups; use PermutationGroup(G,n) to work with larger ones)
+def subgroup(G,n):
+    return set(PermutationGroup(G,n))
+
+# Returns the parabolic subgroup W_I of S_n as a set
+def parabolic_subgroup(I,n):
+    return set(ParabolicSubgroup(I,n))
 
 # Returns the double coset XwY as a set
+# X and Y may be any iterables of permutations (e.g. ParabolicSubgroups), which are
+# only traversed, so they need not be held in memory; Y is traversed once per
+# element of the left coset Xw
 def double_coset(X,w,Y):
-    result = set([w])
-    for x in X:
+    left = set(mult(x,w) for x in X)
+    left.add(w)
+    result = set(left)
+    for z in left:
         for y in Y:
-            result.add(mult(mult(x,w),y))
-    return set(result)
+            result.add(mult(z,y))
+    return result
+
+# Yields the ways of placing the given runs of values at the given positions with
+# each run in increasing order of position, as lists of pairs (position, value)
+def shuffles(runs,positions):
+    if len(runs) <= 1:
+        yield list(zip(positions,runs[0] if runs else []))
+        return
+    first = runs[0]
+    for chosen in combinations(positions,len(first)):
+        rest = [x for x in positions if x not in chosen]
+        for y in shuffles(runs[1:],rest):
+            yield list(zip(chosen,first)) + y
+
+# Yields the minimal representatives of the cosets W_K*y in W_J, for K a subset of J
+# These are the y in W_J with the values of each block of K in increasing order
+# of position, i.e. the shuffles of the blocks of K within each block of J
+# The blocks of J are walked one inside the other, with a fresh shuffles()
+# generator per block at each level, so only one shuffle per block is held in memory
+def min_coset_reps(K,J,n):
+    K = to_mask(K)
+    factors = []
+    for (a,b) in blocks(to_mask(J)):
+        # the values a, ..., b + 1 split into runs joined by the elements of K
+        runs = [[a]]
+        for v in range(a,b + 1):
+            if K >> v & 1:
+                runs[-1].append(v + 1)
+            else:
+                runs.append([v + 1])
+        factors.append((runs,list(range(a,b + 2))))
+    return place_shuffles(list(range(1,n + 1)),factors,0)
+
+# Helper function for min_coset_reps: yields z with the runs of values of
+# factors[i], factors[i + 1], ... shuffled into their positions in every way
+def place_shuffles(z,factors,i):
+    if i == len(factors):
+        yield tuple(z)
+        return
+    (runs,positions) = factors[i]
+    for placement in shuffles(runs,positions):
+        for (p,v) in placement:
+            z[p - 1] = v
+        yield from place_shuffles(z,factors,i + 1)
+
+# The parabolic double coset W_I*w*W_J
+# With w the minimal element, every element of W_I*w*W_J is uniquely x*w*y with x
+# in W_I and y a minimal representative of a coset W_K*y in W_J, where
+# K = J \cap (w^{-1}Iw) = {j in J : w(j + 1) = w(j) + 1 and w(j) in I}
+# So the elements are yielded exactly once each, with no set to deduplicate them,
+# and |W_I*w*W_J| = |W_I||W_J|/|W_K|
+class ParabolicDoubleCoset:
+    def __init__(self,I,w,J):
+        self.n = len(w)
+        self.I = to_mask(I)
+        self.J = to_mask(J)
+        self.w = minimal(self.I,w,self.J)
+        self.K = 0
+        for j in to_indices(self.J):
+            x = self.w[j - 1]
+            if self.w[j] == x + 1 and self.I >> x & 1:
+                self.K |= 1 << j
+        self.size = card_W(self.I) * card_W(self.J) // card_W(self.K)
+
+    def __repr__(self):
+        return 'W_' + str(to_indices(self.I)) + ' ' + str(self.w) + ' W_' + str(to_indices(self.J))
+
+    # Returns |W_I*w*W_J|
+    def __len__(self):
+        return self.size
+
+    # Returns whether z is in W_I*w*W_J, in O(n)
+    def __contains__(self,z):
+        return len(z) == self.n and minimal(self.I,z,self.J) == self.w
+
+    # Yields the elements of W_I*w*W_J, each exactly once
+    # Both loops are lazy walks, so only the current minimal representative and the
+    # current element of W_I (one permutation per block) are held in memory
+    def __iter__(self):
+        W = ParabolicSubgroup(self.I,self.n)
+        for y in min_coset_reps(self.K,self.J,self.n):
+            z = mult(self.w,y)
+            for x in W:
+                yield mult(x,z)
+
+    # Counts the elements of W_I*w*W_J as they are yielded (for testing len)
+    def count(self):
+        result = 0
+        for z in self:
+            result += 1
+        return result
 
 # Returns the parabolic double coset W_IwW_J as a set
 def PDC(I,w,J):
-    return double_coset(parabolic_subgroup(I),w,parabolic_subgroup(J))
+    return set(ParabolicDoubleCoset(I,w,J))
 
-# Returns the symmetric group S_n as a set, using Heap's algorithm (recursive)
+# Returns the symmetric group S_n as a set
+# NOTE: this holds all n! permutations in memory; use S_range(n) to stream them
 def S(n):
-    result = set()
-    generate(n,list(range(1,N + 1)),result)
+    return set(S_range(n))
+
+
+#########################
+# RANKS OF PERMUTATIONS #
+#########################
+
+
+# Permutations of S_n are ranked 0, 1, ..., n! - 1 in lexicographic order.
+# The rank of w is read off from its Lehmer code (L_1, ..., L_n), where L_i is the
+# number of j > i with w(j) < w(i), as the mixed-radix number sum L_i*(n - i)!
+
+# Returns the rank of w in lexicographic order, in O(n log n)
+def perm_rank(w):
+    n = len(w)
+    tree = [0]*(n + 1) # Fenwick tree over the values already seen
+    result = 0
+    for i in range(n):
+        # counting the values smaller than w(i) that have already been seen
+        seen = 0
+        j = w[i] - 1
+        while j > 0:
+            seen += tree[j]
+            j -= j & -j
+        result = result*(n - i) + (w[i] - 1 - seen)
+        j = w[i]
+        while j <= n:
+            tree[j] += 1
+            j += j & -j
     return result
 
-def generate(n,E,result):
-    aux = 0
-    if n == 1:
-          result.add(tuple(E))
-    else:
-        for i in range(n - 1):
-            generate(n - 1,E,result)
-            if n % 2 == 0:
-                # swapping E[i] and E[m-1]
-                aux = E[i]
-                E[i] = E[n - 1]
-                E[n - 1] = aux
-            else:
-                # swapping E[0] and E[m-1]
-                aux = E[0]
-                E[0] = E[n - 1]
-                E[n - 1] = aux
-        generate(n - 1,E,result)
+# Returns the permutation in S_n with the given rank, in O(n log n)
+def perm_unrank(r,n):
+    code = [0]*n # Lehmer code
+    for i in range(1,n + 1):
+        r, code[n - i] = divmod(r,i)
+    tree = [i & -i for i in range(n + 1)] # Fenwick tree over the unused values
+    top = 1
+    while 2*top <= n:
+        top *= 2
+    result = [0]*n
+    for i in range(n):
+        # finding the (code[i] + 1)th smallest unused value
+        x = 0
+        k = code[i] + 1
+        step = top
+        while step > 0:
+            if x + step <= n and tree[x + step] < k:
+                x += step
+                k -= tree[x]
+            step //= 2
+        result[i] = x + 1
+        j = x + 1
+        while j <= n:
+            tree[j] -= 1
+            j += j & -j
+    return tuple(result)
+
+# Yields the permutations of S_n with ranks start, start + 1, ..., stop - 1
+# in lexicographic order, so that only one permutation is held in memory at a time
+# Only the first permutation is unranked; the rest are obtained by stepping to the
+# lexicographic successor, which takes O(1) amortized time
+def S_range(n,start=0,stop=None):
+    if stop is None or stop > math.factorial(n):
+        stop = math.factorial(n)
+    if start >= stop:
+        return
+    E = list(perm_unrank(start,n))
+    yield tuple(E)
+    for r in range(start + 1,stop):
+        # finding the last ascent E[i] < E[i + 1]
+        i = n - 2
+        while E[i] > E[i + 1]:
+            i -= 1
+        # swapping E[i] with the smallest larger entry to its right
+        j = n - 1
+        while E[j] < E[i]:
+            j -= 1
+        E[i], E[j] = E[j], E[i]
+        # the entries after position i are decreasing, so reversing sorts them
+        E[i + 1:] = E[:i:-1]
+        yield tuple(E)
+
+# Yields the permutations of S_n with ranks in [start, stop), in lexicographic
+# order, as lists of (at most) size consecutive permutations
+def chunks_S(n,size,start=0,stop=None):
+    chunk = []
+    for w in S_range(n,start,stop):
+        chunk.append(w)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+# Splits the ranks in [start, stop) (by default all of S_n) into k consecutive
+# ranges of (almost) equal size
+# Returns a list of pairs (a, b), one for each range, e.g. to hand to workers
+def rank_ranges(n,k,start=0,stop=None):
+    if stop is None or stop > math.factorial(n):
+        stop = math.factorial(n)
+    total = max(stop - start,0)
+    result = []
+    for i in range(k):
+        a = start + total*i // k
+        b = start + total*(i + 1) // k
+        if a < b:
+            result.append((a,b))
+    return result
+
+
+###################
+# PARALLEL SWEEPS #
+###################
+
+
+# Number of rank ranges handed to each worker process, so that a slow range
+# does not leave the other workers idle at the end of a sweep
+SHARDS_PER_WORKER = 4
+
+# A pool of worker processes that remembers its size, so that it can be handed
+# down in place of a number of workers and reused by several sweeps
+# concurrent.futures (which imports multiprocessing) is only imported when the
+# first pool is made, so that importing PDC stays cheap
+class WorkerPool:
+    def __init__(self,workers):
+        from concurrent.futures import ProcessPoolExecutor
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.workers = workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.shutdown()
+
+    def submit(self,f,*args,**kwargs):
+        return self.pool.submit(f,*args,**kwargs)
+
+    def map(self,f,*iterables):
+        return self.pool.map(f,*iterables)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+# Calls f(n, *args, start=a, stop=b, **kwargs) for consecutive rank ranges [a, b)
+# covering [start, stop) in S_n, using the given WorkerPool (or a new pool of the
+# given number of worker processes)
+# Returns the list of results in order of rank, so that reducing them is deterministic
+def sharded(f,n,start,stop,workers,*args,**kwargs):
+    if not isinstance(workers,WorkerPool):
+        with WorkerPool(workers) as pool:
+            return sharded(f,n,start,stop,pool,*args,**kwargs)
+    ranges = rank_ranges(n,workers.workers*SHARDS_PER_WORKER,start,stop)
+    futures = [workers.submit(f,n,*args,start=x,stop=y,**kwargs) for (x,y) in ranges]
+    return [future.result() for future in futures]
+
+# Returns the sum of c_w over the permutations w in S_n with the given ranks
+def c_sum(n,ranks):
+    result = 0
+    for r in ranks:
+        result += c(perm_unrank(r,n))
+    return result
+
+# Number of permutations swept between two checkpoints of resumable
+CHECKPOINT_STEP = 100000
+
+# Writes state to the given file atomically: it is pickled to a temporary file in
+# the same directory, which then replaces the file, so the file always holds
+# either the previous checkpoint or the new one
+def save_checkpoint(filename,state):
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.NamedTemporaryFile('wb',dir=directory,delete=False) as f:
+        pickle.dump(state,f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f.name,filename)
+
+# Returns the state saved in the given file, or None if there is no such file
+def load_checkpoint(filename):
+    if not os.path.exists(filename):
+        return None
+    with open(filename,'rb') as f:
+        return pickle.load(f)
+
+# Returns the combination of the results x and y of a sweep over two consecutive
+# rank ranges: their sum (for numbers), union (for sets and Counters) or
+# concatenation (for lists)
+def combine(x,y):
+    if isinstance(x,Counter):
+        x.update(y)
+        return x
+    if isinstance(x,set):
+        return x | y
+    return x + y
+
+# Returns f(n, start=start, stop=stop, workers=workers, **kwargs) for a sweep f over
+# S_n (e.g. p, p3, ocean_multiplicities or rank_size_distribution), computed
+# step ranks at a time (by default CHECKPOINT_STEP), saving the progress (the next
+# rank and the result so far) to the given checkpoint file after each step
+# If the file already holds a checkpoint of the same sweep, the sweep resumes from
+# it, so rerunning an interrupted sweep gives the same result as an uninterrupted one
+# The checkpoint file is removed once the sweep is finished, so a later sweep
+# always computes its result afresh
+# Each step is sharded across the worker processes, if workers is given, with one
+# pool kept for the whole sweep rather than a new one per step
+def resumable(f,n,filename,start=0,stop=None,workers=None,step=None,**kwargs):
+    if workers is not None and not isinstance(workers,WorkerPool):
+        with WorkerPool(workers) as pool:
+            return resumable(f,n,filename,start,stop,pool,step,**kwargs)
+    N = math.factorial(n)
+    if stop is None or stop > N:
+        stop = N
+    if step is None:
+        step = CHECKPOINT_STEP
+    state = load_checkpoint(filename)
+    sweep = (f.__name__,n,start,stop)
+    if state is None:
+        state = {'sweep': sweep, 'next': start, 'result': f(n,start=start,stop=start,**kwargs)}
+    elif state['sweep'] != sweep:
+        raise ValueError(filename + ' is a checkpoint of a different sweep: ' + str(state['sweep']))
+    while state['next'] < stop:
+        a = state['next']
+        b = min(a + step,stop)
+        state['result'] = combine(state['result'],f(n,start=a,stop=b,workers=workers,**kwargs))
+        state['next'] = b
+        save_checkpoint(filename,state)
+    if os.path.exists(filename):
+        os.remove(filename)
+    return state['result']
+
+# A compact collection of permutations in S_n, stored as consecutive rows of
+# an array of bytes (n <= 255) instead of as a set of tuples
+class PermArray:
+    def __init__(self,n,perms=()):
+        self.n = n
+        self.data = array('B')
+        for w in perms:
+            self.append(w)
+
+    def __len__(self):
+        return len(self.data) // self.n
+
+    def __getitem__(self,i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PermArray index out of range')
+        return tuple(self.data[i*self.n:(i + 1)*self.n])
+
+    def __iter__(self):
+        for i in range(0,len(self.data),self.n):
+            yield tuple(self.data[i:i + self.n])
+
+    def __repr__(self):
+        return 'PermArray(' + str(self.n) + ', ' + str(len(self)) + ' permutations)'
+
+    # Appends the permutation w
+    def append(self,w):
+        self.data.extend(w)
+
+    # Returns the ranks of the stored permutations as an array
+    def ranks(self):
+        return array('Q', (perm_rank(w) for w in self))
+
+    # Returns a PermArray holding the permutations with the given ranks
+    @classmethod
+    def from_ranks(cls,n,ranks):
+        return cls(n,(perm_unrank(r,n) for r in ranks))
 
 
 ############
@@ -533,18 +1220,22 @@ def generate(n,E,result):
 # Draws the w-ocean
 # Saves it to a postscript file named "(w(1), w(2), ..., w(n))-ocean.eps" if save == True
 def drawOcean2(w,save):
+    if turtle is None:
+        init_turtle()
+    n = len(w)
     turtle.clear()
     x = -500 # inital x-position
     y = 100 # initial y-position of top row
     r = 10 # inner vertex radius
     R = 15 # outer vertex radius (for large ascents)
-    dx = int((1000 - (2*r*(N - 1)))/(N - 2)) # horizontal spacing between vertices
+    dx = int((1000 - (2*r*(n - 1)))/(n - 2)) # horizontal spacing between vertices
+    d = descriptor(w)
     # top row
-    drawRow(x,y,dx,r,R,rightAscentSet(w),smallRightAscentSet(w),largeRightAscentSet(w))
+    drawRow(x,y,dx,r,R,n,to_set(d.rightAscents),to_set(d.smallRight),to_set(d.largeRight))
     # bottom row
-    drawRow(x,-y,dx,r,R,leftAscentSet(w),smallLeftAscentSet(w),largeLeftAscentSet(w))
+    drawRow(x,-y,dx,r,R,n,to_set(d.leftAscents),to_set(d.smallLeft),to_set(d.largeLeft))
     # drawing planks
-    for i in smallRightAscentSet(w):
+    for i in to_set(d.smallRight):
         turtle.setposition(-500 + dx*(i - 1) + r*(i - 1), y - r)
         turtle.down()
         turtle.setposition(-500 + dx*(w[i - 1] - 1) + r*(w[i - 1] - 1), r - y)
@@ -558,20 +1249,19 @@ def drawOcean2(w,save):
 def drawOcean(w):
     init_turtle()
     n = len(w)
-    if N != n:
-        set_N(n)
     turtle.clear()
     x = -500 # inital x-position
     y = 100 # initial y-position of top row
     r = 10 # inner vertex radius
     R = 15 # outer vertex radius (for large ascents)
-    dx = int((1000 - (2*r*(N - 1)))/(N - 2)) # horizontal spacing between vertices
+    dx = int((1000 - (2*r*(n - 1)))/(n - 2)) # horizontal spacing between vertices
+    d = descriptor(w)
     # top row
-    drawRow(x,y,dx,r,R,rightAscentSet(w),smallRightAscentSet(w),largeRightAscentSet(w))
+    drawRow(x,y,dx,r,R,n,to_set(d.rightAscents),to_set(d.smallRight),to_set(d.largeRight))
     # bottom row
-    drawRow(x,-y,dx,r,R,leftAscentSet(w),smallLeftAscentSet(w),largeLeftAscentSet(w))
+    drawRow(x,-y,dx,r,R,n,to_set(d.leftAscents),to_set(d.smallLeft),to_set(d.largeLeft))
     # drawing planks
-    for i in smallRightAscentSet(w):
+    for i in to_set(d.smallRight):
         turtle.setposition(-500 + dx*(i - 1) + r*(i - 1), y - r)
         turtle.down()
         turtle.setposition(-500 + dx*(w[i - 1] - 1) + r*(w[i - 1] - 1), r - y)
@@ -584,13 +1274,14 @@ def drawOcean(w):
 # dx = horizontal spacing between vertices
 # r = inner vertex radius
 # R = outer vertex radius (for large ascents)
+# n = size of w
 # rightAscent = right ascent set of w
 # smallRight = small right ascent set of w
 # largeRight = large right ascent set of w
-def drawRow(x,y,dx,r,R,rightAscent,smallRight,largeRight):
+def drawRow(x,y,dx,r,R,n,rightAscent,smallRight,largeRight):
     turtle.up()
     turtle.setposition(x,y)
-    for i in range(1,N):
+    for i in range(1,n):
         # drawing inner circle
         turtle.setposition(x, y - r)
         turtle.down()
@@ -618,7 +1309,7 @@ def drawRow(x,y,dx,r,R,rightAscent,smallRight,largeRight):
         # drawing horizontal line
         if ((i in smallRight) and (i + 1 in rightAscent)) or ((i in rightAscent) and (i + 1 in smallRight)):
             turtle.down()
-        if i + 1 < N:
+        if i + 1 < n:
             x = x + dx
             turtle.setposition(x - r, y)
             turtle.up()
@@ -628,115 +1319,248 @@ def drawRow(x,y,dx,r,R,rightAscent,smallRight,largeRight):
 # Draws the w-ocean of every permutation in S_n and saves them to current directory
 # (i.e. the same directory as PDC.py)
 def draw_S(n):
-    if n != N:
-        set_N(n)
-    for w in S(n):
+    for w in S_range(n):
         drawOcean2(w,True)
 
+# Everything about a permutation w that its w-ocean is made from, computed in
+# a single linear pass over w
+# Sets of indices are stored as bitmasks: bit k is set iff s_k is in the set
+class OceanDescriptor:
+    __slots__ = ('w', 'n', 'inv',
+                 'rightAscents', 'leftAscents', 'rightDescents', 'leftDescents',
+                 'smallRight', 'smallLeft', 'largeRight', 'largeLeft',
+                 'rightFloats', 'leftFloats', 'rightRopes', 'leftRopes',
+                 'rightTethers', 'leftTethers', 'rafts')
+
+    def __init__(self,w):
+        n = len(w)
+        self.w = w
+        self.n = n
+        inv = [0]*(n + 1) # inv[v] is the position of the value v
+        for i in range(n):
+            inv[w[i]] = i + 1
+        self.inv = inv
+        rightAscents = leftAscents = smallRight = smallLeft = 0
+        rafts = []
+        a = 0 # start of the current raft, if any
+        for k in range(1,n):
+            bit = 1 << k
+            if w[k - 1] < w[k]:
+                rightAscents |= bit
+                if w[k - 1] + 1 == w[k]:
+                    smallRight |= bit
+                    if a == 0:
+                        a = k
+            if a != 0 and not smallRight & bit:
+                rafts.append((a, k - 1, w[a - 1], w[k - 2]))
+                a = 0
+            if inv[k] < inv[k + 1]:
+                leftAscents |= bit
+                if inv[k] + 1 == inv[k + 1]:
+                    smallLeft |= bit
+        if a != 0:
+            rafts.append((a, n - 1, w[a - 1], w[n - 2]))
+        self.set_masks(rightAscents,leftAscents,smallRight,smallLeft,tuple(rafts))
+
+    # Sets the ascent and small ascent masks, and everything derived from them
+    def set_masks(self,rightAscents,leftAscents,smallRight,smallLeft,rafts):
+        full = (1 << self.n) - 2 # bits 1, ..., n - 1
+        self.rightAscents = rightAscents
+        self.leftAscents = leftAscents
+        self.rightDescents = full & ~rightAscents
+        self.leftDescents = full & ~leftAscents
+        self.smallRight = smallRight
+        self.smallLeft = smallLeft
+        self.rightFloats, self.rightRopes, self.rightTethers, self.largeRight = classify(rightAscents,smallRight)
+        self.leftFloats, self.leftRopes, self.leftTethers, self.largeLeft = classify(leftAscents,smallLeft)
+        self.rafts = rafts
+
+    # Returns the OceanDescriptor of w*s_i, updated from this one
+    # Swapping the entries a, b in positions i, i + 1 only changes the right ascents
+    # s_(i - 1), s_i, s_(i + 1) and the left ascents s_(a - 1), s_a, s_(b - 1), s_b,
+    # and the rafts only change if the small right ascents do
+    def swapped(self,i):
+        n = self.n
+        w = list(self.w)
+        inv = list(self.inv)
+        a = w[i - 1]
+        b = w[i]
+        w[i - 1] = b
+        w[i] = a
+        inv[a] = i + 1
+        inv[b] = i
+        rightAscents = self.rightAscents
+        smallRight = self.smallRight
+        for k in (i - 1, i, i + 1):
+            if 0 < k < n:
+                bit = 1 << k
+                rightAscents &= ~bit
+                smallRight &= ~bit
+                if w[k - 1] < w[k]:
+                    rightAscents |= bit
+                    if w[k - 1] + 1 == w[k]:
+                        smallRight |= bit
+        leftAscents = self.leftAscents
+        smallLeft = self.smallLeft
+        for k in (a - 1, a, b - 1, b):
+            if 0 < k < n:
+                bit = 1 << k
+                leftAscents &= ~bit
+                smallLeft &= ~bit
+                if inv[k] < inv[k + 1]:
+                    leftAscents |= bit
+                    if inv[k] + 1 == inv[k + 1]:
+                        smallLeft |= bit
+        rafts = self.rafts
+        if smallRight != self.smallRight:
+            rafts = tuple((x, y, w[x - 1], w[y - 1]) for (x,y) in blocks(smallRight))
+        result = object.__new__(OceanDescriptor)
+        result.w = tuple(w)
+        result.n = n
+        result.inv = inv
+        result.set_masks(rightAscents,leftAscents,smallRight,smallLeft,rafts)
+        return result
+
+    # Returns the w-ocean, in the same form as ocean(w)
+    def ocean(self):
+        return (self.rafts,
+                to_indices(self.leftFloats,True) + to_indices(self.rightFloats),
+                to_indices(self.leftRopes,True) + to_indices(self.rightRopes),
+                to_indices(self.leftTethers,True) + to_indices(self.rightTethers))
+
+    # Returns the number of floats in the w-ocean
+    def num_floats(self):
+        return bin(self.rightFloats).count('1') + bin(self.leftFloats).count('1')
+
+    # Boundary apparatus (I,J,K,L) of the raft R, as in bd(w,ropes(w),T,R), where the
+    # tethers in T are given by the masks rightT (top row) and leftT (bottom row)
+    def bd(self,R,rightT=0,leftT=0):
+        I = J = K = L = 0
+        if R[0] - 1 > 0:
+            if self.leftRopes >> (R[2] - 1) & 1:
+                I = 10
+            elif leftT >> (R[2] - 1) & 1:
+                I = 1
+            if self.rightRopes >> (R[0] - 1) & 1:
+                J = 10
+            elif rightT >> (R[0] - 1) & 1:
+                J = 1
+        if R[1] < self.n - 1:
+            if self.leftRopes >> (R[3] + 1) & 1:
+                K = 10
+            elif leftT >> (R[3] + 1) & 1:
+                K = 1
+            if self.rightRopes >> (R[1] + 1) & 1:
+                L = 10
+            elif rightT >> (R[1] + 1) & 1:
+                L = 1
+        return (I,J,K,L)
+
+# Given the ascent and small ascent masks of one row of a w-ocean, returns the masks
+# (floats, ropes, tethers, large ascents) of that row
+# A large ascent is a float, rope or tether when 0, 1 or 2 of its neighbours are small ascents
+def classify(ascents,small):
+    large = ascents & ~small
+    before = small << 1 # bit k is set iff s_(k-1) is a small ascent
+    after = small >> 1 # bit k is set iff s_(k+1) is a small ascent
+    floatMask = large & ~before & ~after
+    tetherMask = large & before & after
+    return (floatMask, large & ~floatMask & ~tetherMask, tetherMask, large)
+
+# Returns the OceanDescriptor of w
+def descriptor(w):
+    return OceanDescriptor(w)
+
+# Yields the positions i of the adjacent transpositions s_i that take each
+# permutation of S_n to the next in Steinhaus-Johnson-Trotter order (plain changes),
+# starting from the identity, in O(1) amortised time per step
+# (Algorithm P in Knuth, TAOCP 7.2.1.2)
+def sjt_swaps(n):
+    c = [0]*(n + 1)
+    o = [1]*(n + 1)
+    while True:
+        j = n
+        s = 0
+        while True:
+            q = c[j] + o[j]
+            if q >= 0 and q != j:
+                break
+            if q == j:
+                if j == 1:
+                    return
+                s += 1
+            o[j] = -o[j]
+            j -= 1
+        yield min(j - c[j] + s, j - q + s)
+        c[j] = q
+
+# Yields (d, l) for every permutation w of S_n, where d is the OceanDescriptor of w
+# and l its length, in Steinhaus-Johnson-Trotter order
+# Consecutive permutations differ by one adjacent transposition, so the length
+# changes by 1 and the masks of d are updated (with OceanDescriptor.swapped) rather
+# than recomputed
+def sjt_S(n):
+    d = descriptor(identity(n))
+    l = 0
+    yield (d,l)
+    for i in sjt_swaps(n):
+        if d.w[i - 1] < d.w[i]:
+            l += 1
+        else:
+            l -= 1
+        d = d.swapped(i)
+        yield (d,l)
+
+# Yields the OceanDescriptors of the permutations of S_n with rank in [start, stop)
+# A sweep of all of S_n goes in Steinhaus-Johnson-Trotter order (see sjt_S) and
+# any other range in lexicographic order
+def descriptors_S(n,start=0,stop=None):
+    if start == 0 and (stop is None or stop >= math.factorial(n)):
+        for (d,l) in sjt_S(n):
+            yield d
+    else:
+        for w in S_range(n,start,stop):
+            yield descriptor(w)
+
 # Returns the number of floats in the w-ocean
 def num_floats(w):
-    result = 0
-    for i in range(1,N):
-        if isLargeRightAscent(w,i):
-            if i == 1 or not isSmallRightAscent(w, i - 1):
-                if i + 1 == N or (not isSmallRightAscent(w, i + 1)):
-                    result += 1
-        if isLargeLeftAscent(w,i):
-            if i == 1 or not isSmallLeftAscent(w, i - 1):
-                if i + 1 == N or not isSmallLeftAscent(w, i + 1):
-                    result += 1
-    return result
+    return descriptor(w).num_floats()
 
 # NOTE: negative indices will indicate indices in the BOTTOM row
 
 # Returns the set of indices of floats of w
 def floats(w):
-    result = set()
-    for i in range(1,N):
-        if isLargeRightAscent(w,i):
-            if i == 1 or not isSmallRightAscent(w, i - 1):
-                if i + 1 == N or (not isSmallRightAscent(w, i + 1)):
-                    result.add(i)
-        if isLargeLeftAscent(w,i):
-            if i == 1 or not isSmallLeftAscent(w, i - 1):
-                if i + 1 == N or not isSmallLeftAscent(w, i + 1):
-                    result.add(-1*i)
-    return result
+    return set(descriptor(w).ocean()[1])
 
-# Returns the set of rafts of w as a set of 3-tuples
-# (a,b,w(a)) indicates there is a raft from s_a to s_b (in the top row)
+# Returns the set of rafts of w as a set of 4-tuples
+# (a,b,w(a),w(b)) indicates there is a raft from s_a to s_b (in the top row)
 # connecting to the raft from s_w(a) to s_w(b) (in the bottom row)
 def rafts(w):
-    result = set()
-    l = list(smallRightAscentSet(w))
-    l.sort()
-    if len(l) == 0:
-        return result
-    a = l[0]
-    for i in range(len(l) - 1):
-        if i == len(l) - 1:
-            result.add((a, l[i], w[a - 1], w[l[i] - 1]))
-        elif l[i + 1] != l[i] + 1:
-            result.add((a, l[i], w[a - 1], w[l[i] - 1]))
-            a = l[i + 1]
-    result.add((a, l[-1], w[a - 1], w[l[-1] - 1]))
-    return result
+    return set(descriptor(w).rafts)
 
 # Returns the set of indices of right ropes of w
 def rightRopes(w):
-    result = set()
-    for i in range(1,N):
-        if isLargeRightAscent(w,i):
-            if i == 1:
-                if isSmallRightAscent(w, i + 1):
-                    result.add(i)
-            elif i == N - 1:
-                if isSmallRightAscent(w, i - 1):
-                    result.add(i)
-            elif (isSmallRightAscent(w, i - 1) and (not isSmallRightAscent(w,i+1))) or ((not isSmallRightAscent(w,i-1)) and isSmallRightAscent(w,i+1)):
-                result.add(i)
-    return result
+    return to_set(descriptor(w).rightRopes)
 
 # Returns the set of indices of left ropes of w
 def leftRopes(w):
-    result = set()
-    for i in range(1,N):
-        if isLargeLeftAscent(w,i):
-            if i == 1:
-                if isSmallLeftAscent(w, i + 1):
-                    result.add(-1*i)
-            elif i == N - 1:
-                if isSmallLeftAscent(w, i - 1):
-                    result.add(-1*i)
-            elif (isSmallLeftAscent(w,i-1) and not isSmallLeftAscent(w,i+1)) or (not isSmallLeftAscent(w,i-1) and isSmallLeftAscent(w,i+1)):
-                result.add(-1*i)
-    return result
+    return set(to_indices(descriptor(w).leftRopes,True))
 
 # Returns the set of indices of ropes of w
 def ropes(w):
-    return rightRopes(w).union(leftRopes(w))
+    return set(descriptor(w).ocean()[2])
     
 # Returns the set of indices of right tethers of w
 def rightTethers(w):
-    result = set()
-    for i in range(2, N - 1):
-        if isLargeRightAscent(w,i):
-            if i + 1 < N and isSmallRightAscent(w, i + 1) and isSmallRightAscent(w, i - 1):
-                result.add(i)
-    return result
+    return to_set(descriptor(w).rightTethers)
 
 # Returns the set of indices of left tethers of w
 def leftTethers(w):
-    result = set()
-    for i in range(2, N - 1):
-        if isLargeLeftAscent(w,i):
-            if i + 1 < N and isSmallLeftAscent(w, i + 1) and isSmallLeftAscent(w, i - 1):
-                result.add(-1*i)
-    return result
+    return set(to_indices(descriptor(w).leftTethers,True))
 
 # Returns the set of indices of tethers of w
 def tethers(w):
-    return rightTethers(w).union(leftTethers(w))
+    return set(descriptor(w).ocean()[3])
 
 # Returns the w-ocean as a 4-tuple of tuples
 # First tuple contains rafts
@@ -745,34 +1569,100 @@ def tethers(w):
 # Fourth tuple contains tethers
 # Each tuple is sorted so that oceans will be comparable
 def ocean(w):
-    raft_list = list(rafts(w))
-    raft_list.sort()
-    float_list = list(floats(w))
-    float_list.sort()
-    rope_list = list(ropes(w))
-    rope_list.sort()
-    tether_list = list(tethers(w))
-    tether_list.sort()
-    return (tuple(raft_list), tuple(float_list), tuple(rope_list), tuple(tether_list))
+    return descriptor(w).ocean()
 
 # Returns the set of w-oceans in S_n
-def oceans_S(n):
-    if n != N:
-        set_N(n)
+# (of the permutations with ranks in [start, stop), if given)
+def oceans_S(n,start=0,stop=None):
     result = set()
-    for w in S(n):
-        result.add(ocean(w))
+    for d in descriptors_S(n,start,stop):
+        result.add(d.ocean())
     return result
 
+# Returns the Counter mapping each w-ocean of a permutation in S_n (with rank in
+# [start, stop), if given) to the number of those permutations with that w-ocean
+# If workers is given, the sweep is split across that many worker processes and
+# the Counters of the parts are added up
+# If checkpoint is given, the sweep saves its progress to that file (see resumable)
+def ocean_multiplicities(n,start=0,stop=None,workers=None,checkpoint=None):
+    if checkpoint is not None:
+        return resumable(ocean_multiplicities,n,checkpoint,start,stop,workers)
+    result = Counter()
+    if workers is not None:
+        for x in sharded(ocean_multiplicities,n,start,stop,workers):
+            result.update(x)
+        return result
+    for d in descriptors_S(n,start,stop):
+        result[d.ocean()] += 1
+    return result
+
+# Yields the pairs (d, m) of the OceanDescriptor d of a w-ocean in S_n and the number
+# m of permutations in S_n with that w-ocean, without a sweep of S_n
+# (d.w is None, since d stands for m permutations, but d.ocean() and c(None,d) work)
+# The permutations are built by placing the values 1, ..., n one at a time. The
+# w-ocean only depends on the right and left ascents and the small right ascents
+# s_i together with w(i), and each partial permutation only needs the positions
+# filled so far and the position of the last value placed to go on, so partial
+# permutations that agree on these are counted together:
+# - placing k + 1 at position q decides the left ascent s_k (q > position of k)
+# - it decides the right ascents s_(q - 1) (if q - 1 is filled, as w(q - 1) < k + 1)
+#   and s_q (never, if q + 1 is filled)
+# - s_(q - 1) is small iff k sits at position q - 1
+# The number of classes grows more slowly than n! (2.0, 1.6 and 1.2 times n! classes
+# are visited for n = 8, 9, 10), and so does the number of w-oceans
+def ocean_shapes(n):
+    states = Counter()
+    for q in range(1,n + 1):
+        states[(1 << q,q,0,0,())] += 1
+    for k in range(1,n):
+        aux = Counter()
+        for ((filled,p,rightAscents,leftAscents,small),m) in states.items():
+            for q in range(1,n + 1):
+                if filled >> q & 1:
+                    continue
+                right = rightAscents
+                left = leftAscents
+                s = small
+                if q > p:
+                    left |= 1 << k
+                if filled >> (q - 1) & 1:
+                    right |= 1 << (q - 1)
+                    if q - 1 == p:
+                        s = small + ((p,k),)
+                if k == n - 1:
+                    aux[(right,left,s)] += m # the last value, so only the w-ocean is left
+                else:
+                    aux[(filled | 1 << q,q,right,left,s)] += m
+        states = aux
+    for (key,m) in states.items():
+        (rightAscents,leftAscents,small) = key[-3:]
+        smallRight = smallLeft = 0
+        value = dict()
+        for (i,v) in small:
+            smallRight |= 1 << i
+            smallLeft |= 1 << v
+            value[i] = v
+        d = object.__new__(OceanDescriptor)
+        d.w = None
+        d.n = n
+        d.inv = None
+        d.set_masks(rightAscents,leftAscents,smallRight,smallLeft,
+                    tuple((a,b,value[a],value[b]) for (a,b) in blocks(smallRight)))
+        yield (d,m)
+
 # Returns the set of duplicate w-oceans in S_n
 # (w-oceans that belong to more than one permutation)
-def duplicates(n):
-    if n != N:
-        set_N(n)
+# (among the permutations with ranks in [start, stop), if given)
+# If checkpoint is given, the w-oceans are counted by a resumable sweep that saves
+# its progress to that file (see resumable)
+def duplicates(n,start=0,stop=None,checkpoint=None,workers=None):
+    if checkpoint is not None or workers is not None:
+        m = ocean_multiplicities(n,start,stop,workers,checkpoint)
+        return set(o for o in m if m[o] > 1)
     result = set()
     duplicates = set()
-    for w in S(n):
-        o = ocean(w)
+    for d in descriptors_S(n,start,stop):
+        o = d.ocean()
         if o in result:
             duplicates.add(o)
         result.add(o)
@@ -784,11 +1674,9 @@ def duplicates(n):
 # Saves the list to text file if save_text == true
 # Saves w-ocean .eps files to current directory if save_pic == true
 def duplicate_pairs(n,printing,save_text,save_pic):
-    if n != N:
-        set_N(n)
     result = list()
     d = duplicates(n)
-    for w in S(n):
+    for w in S_range(n):
         o = ocean(w)
         if o in d:
             result.append((o,w))
@@ -820,6 +1708,7 @@ def duplicate_pairs(n,printing,save_text,save_pic):
 # I,J,K,L correspond to bottom left, top left, bottom right, and top right
 # corners of the raft, respectively
 def bd(w,ropeSet,T,R):
+    n = len(w)
     I = J = K = L = 0
     if R[0] - 1 > 0:
         if -1*(w[R[0]-1] - 1) in ropeSet:
@@ -830,7 +1719,7 @@ def bd(w,ropeSet,T,R):
             J = 10
         elif R[0] - 1 in T:
             J = 1
-    if R[1] < N - 1:
+    if R[1] < n - 1:
         if -1*(w[R[1]-1] + 1) in ropeSet:
             K = 10
         elif -1*(w[R[1]-1] + 1) in T:
@@ -841,7 +1730,7 @@ def bd(w,ropeSet,T,R):
             L = 1
     return (I,J,K,L)
 
-def bd2(ropeSet,T,R):
+def bd2(ropeSet,T,R,n):
     I = J = K = L = 0
     if R[0] - 1 > 0:
         if -1*(R[2] - 1) in ropeSet:
@@ -852,7 +1741,7 @@ def bd2(ropeSet,T,R):
             J = 10
         elif R[0] - 1 in T:
             J = 1
-    if R[1] < N - 1:
+    if R[1] < n - 1:
         if -1*(R[2] + (R[1] - R[0]) + 1) in ropeSet:
             K = 10
         elif -1*(R[2] + (R[1] - R[0]) + 1) in T:
@@ -865,7 +1754,63 @@ def bd2(ropeSet,T,R):
 
 # Returns c_w, the number of parabolic double cosets in S_n with
 # minimal length element w
-def c(w):
+# (d is the OceanDescriptor of w, if already known)
+def c(w,d=None):
+    if d is None:
+        d = descriptor(w)
+    if d.rightTethers or d.leftTethers:
+        return c2(d.ocean(),d.n)
+    # without tethers, c_w is a single product over the rafts
+    result = 1
+    for R in d.rafts:
+        result *= b(bd_dict[d.bd(R)], R[1] - R[0] + 1)
+    return pow(2,d.num_floats())*result
+
+# Returns c_w for the given w-ocean of a permutation w in S_n
+# c_w is a sum over the subsets T of the tethers of a product over the rafts,
+# in which each factor only depends on the tethers at the corners of its raft.
+# Each tether is a corner of (at most) two rafts, so the sum is computed by
+# visiting the rafts in order along the top row and only remembering the
+# tethers that have been seen at one of their rafts but not yet at the other,
+# keeping one partial sum for each choice of which of those tethers are in T.
+# This takes time linear in the number of rafts (times 2 to the number of
+# tethers remembered at once), instead of 2^|tethers| passes over all rafts.
+def c2(o,n):
+    ropeSet = set(o[2])
+    tetherSet = set(o[3])
+    # the tethers at the corners of each raft, and the last raft each tether is a corner of
+    corners = []
+    last = dict()
+    for x in range(len(o[0])):
+        R = o[0][x]
+        C = []
+        for t in (R[0] - 1, R[1] + 1, -1*(R[2] - 1), -1*(R[2] + (R[1] - R[0]) + 1)):
+            if t in tetherSet:
+                C.append(t)
+                last[t] = x
+        corners.append(C)
+    # partial sums, keyed by the set of remembered tethers that are in T
+    states = {frozenset() : 1}
+    seen = set()
+    for x in range(len(o[0])):
+        R = o[0][x]
+        new = [t for t in corners[x] if t not in seen]
+        seen.update(new)
+        aux = dict()
+        for T, value in states.items():
+            for bits in product((False,True), repeat=len(new)):
+                U = T.union([new[i] for i in range(len(new)) if bits[i]])
+                factor = b(bd_dict[bd2(ropeSet,U,R,n)], R[1] - R[0] + 1)
+                key = frozenset(t for t in U if last[t] != x)
+                aux[key] = aux.get(key,0) + value*factor
+        states = aux
+    result = sum(states.values())
+    # tethers that are not a corner of any raft contribute a factor of 2
+    return pow(2,len(o[1]) + len(tetherSet) - len(last))*result
+
+# Returns c_w, summing over every subset of the tethers of w
+# (the original implementation, kept to validate c)
+def c_naive(w):
     result = 0
     for T in powerset(tethers(w)):
         product = 1
@@ -874,78 +1819,172 @@ def c(w):
         result += product
     return pow(2,num_floats(w))*result
 
-# Returns c_w for the given w-ocean
-def c2(o):
+# Returns c_w for the given w-ocean, summing over every subset of the tethers
+# (the original implementation, kept to validate c2)
+def c2_naive(o,n):
     result = 0
     for T in powerset(o[3]):
         product = 1
         for R in o[0]:
-            product *= b(bd_dict[bd2(o[2],T,R)], R[1] - R[0] + 1)
+            product *= b(bd_dict[bd2(o[2],T,R,n)], R[1] - R[0] + 1)
         result += product
     return pow(2,len(o[1]))*result
     
+# Returns the list of pairs (w, c_w) for the permutations w in S_n
+# with rank in [start, stop), in order of rank
+def cw_list(n,start=0,stop=None,workers=None):
+    if workers is not None:
+        return [x for part in sharded(cw_list,n,start,stop,workers) for x in part]
+    result = []
+    for w in S_range(n,start,stop):
+        result.append((w,c(w)))
+    return result
+
 # Prints c_w for each permutation w in S_n
-def print_cw(n):
-    if n != N:
-        set_N(n)
-    for w in S(n):
+# (with rank in [start, stop), if given)
+# The c_w are computed by the given number of worker processes, if given
+def print_cw(n,start=0,stop=None,workers=None):
+    if workers is not None:
+        for (w,x) in cw_list(n,start,stop,workers):
+            print('c_' + str(w) + ' = ' + str(x))
+        return
+    for w in S_range(n,start,stop):
         print('c_' + str(w) + ' = ' + str(c(w)))
     
 # Returns p_n, the number of parabolic double cosets in S_n
-def p(n):
-    if n != N:
-        set_N(n)
+# If start and stop are given, only sums c_w over the permutations w
+# with rank in [start, stop)
+# If workers is given, the sum is split across that many worker processes
+# If checkpoint is given, the sweep saves its progress to that file, and resumes
+# from it if it was interrupted (see resumable)
+def p(n,start=0,stop=None,workers=None,checkpoint=None):
+    if checkpoint is not None:
+        return resumable(p,n,checkpoint,start,stop,workers)
+    if workers is not None:
+        return sum(sharded(p,n,start,stop,workers))
     result = 0
-    for w in S(n):
-        result += c(w)
+    for d in descriptors_S(n,start,stop):
+        result += c(d.w,d)
     return result
 
 # Returns the set {w in S_n | c_w = k}
-def cw_class(n,k):
-    if n != N:
-        set_N(n)
+# (restricted to the permutations with rank in [start, stop), if given)
+# Returns the permutations as a PermArray, in order of rank, if compact == True
+def cw_class(n,k,start=0,stop=None,compact=False,workers=None):
+    if workers is not None:
+        parts = sharded(cw_class,n,start,stop,workers,k,compact=compact)
+        if compact:
+            result = PermArray(n)
+            for part in parts:
+                result.data.extend(part.data)
+            return result
+        return set().union(*parts)
+    if compact:
+        result = PermArray(n)
+        for w in S_range(n,start,stop):
+            if c(w) == k:
+                result.append(w)
+        return result
     result = set()
-    for w in S(n):
+    for w in S_range(n,start,stop):
         if c(w) == k:
             result.add(w)
     return result
 
+# c_w is constant on the WXML equivalence class (orbit) {w, w^-1, w0*w*w0, w0*w^-1*w0}
+# of w, so sums of c_w over S_n only need c_w for one permutation in each class,
+# weighted by the size of the class (1, 2 or 4)
+
+# Returns the WXML equivalence class of w as a set
+def orbit(w):
+    n = len(w)
+    w0 = longest(n)
+    x = inverse(w)
+    return set([w,x,mult(w0,mult(w,w0)),mult(w0,mult(x,w0))])
+
+# Yields (w, k) for the permutations w with rank in [start, stop) that are the
+# smallest (in lexicographic order) in their WXML equivalence class, where k is
+# the size of the class
+# Each permutation is only compared with the rest of its class, so nothing is stored
+def orbit_representatives(n,start=0,stop=None):
+    G = SymmetricGroup(n)
+    for w in S_range(n,start,stop):
+        x = inverse(w)
+        if x < w:
+            continue
+        y = G.conjugate(w)
+        if y < w:
+            continue
+        z = G.conjugate(x)
+        if z < w:
+            continue
+        yield (w,len(set([w,x,y,z])))
+
 # Returns p_n (uses WXML equivalence classes)
-def p2(n):
-    if n != N:
-        set_N(n)
-    WXML = dict()
+# If start and stop are given, only sums over the classes whose smallest permutation
+# has rank in [start, stop) (so the sums over a partition of the ranks add up to p_n)
+# (checkpoint is as in p)
+def p2(n,start=0,stop=None,workers=None,checkpoint=None):
+    if checkpoint is not None:
+        return resumable(p2,n,checkpoint,start,stop,workers)
+    if workers is not None:
+        return sum(sharded(p2,n,start,stop,workers))
     result = 0
-    for w in S(n):
-        if w not in WXML:
-            WXML[w] = WXML[inverse(w)] = WXML[mult(w0,mult(w,w0))] = WXML[mult(w0,mult(inverse(w),w0))] = c(w)
-        result += WXML[w]
+    for (w,k) in orbit_representatives(n,start,stop):
+        result += k*c(w)
     return result
 
 # Returns p_n (uses duplicate oceans)
-def p3(n):
-    if n != N:
-        set_N(n)
+# If cache is given (an OceanCache or its file name), c_w is looked up in it and the
+# values computed are added to it
+# (checkpoint is as in p)
+def p3(n,start=0,stop=None,workers=None,cache=None,checkpoint=None):
+    if checkpoint is not None:
+        cache = shared_cache(cache)
+        return resumable(p3,n,checkpoint,start,stop,workers,cache=cache)
+    if workers is not None:
+        cache = shared_cache(cache)
+        return sum(sharded(p3,n,start,stop,workers,cache=cache))
+    if cache is not None:
+        return cached_sum(n,((d,1) for d in descriptors_S(n,start,stop)),cache)
     OCEANS = dict()
     result = 0
-    for w in S(n):
-        o = ocean(w)
+    for d in descriptors_S(n,start,stop):
+        o = d.ocean()
         if o not in OCEANS:
-            OCEANS[o] = c(w)
+            OCEANS[o] = c(d.w,d)
         result += OCEANS[o]
     return result
 
 # Returns p_n (uses duplicate oceans and WXML equivalence classes)
-def p4(n):
-    if n != N:
-        set_N(n)
+# (start and stop are as in p2, cache as in p3 and checkpoint as in p)
+def p4(n,start=0,stop=None,workers=None,cache=None,checkpoint=None):
+    if checkpoint is not None:
+        cache = shared_cache(cache)
+        return resumable(p4,n,checkpoint,start,stop,workers,cache=cache)
+    if workers is not None:
+        cache = shared_cache(cache)
+        return sum(sharded(p4,n,start,stop,workers,cache=cache))
+    if cache is not None:
+        return cached_sum(n,((descriptor(w),k) for (w,k) in orbit_representatives(n,start,stop)),cache)
     OCEANS = dict()
     result = 0
-    for w in S(n):
-        o = ocean(w)
+    for (w,k) in orbit_representatives(n,start,stop):
+        d = descriptor(w)
+        o = d.ocean()
         if o not in OCEANS:
-            OCEANS[o] = OCEANS[ocean(inverse(w))] = OCEANS[mult(w0,mult(w,w0))] = OCEANS[mult(w0,mult(inverse(w),w0))] = c(w)
-        result += OCEANS[o]
+            OCEANS[o] = c(w,d)
+        result += k*OCEANS[o]
+    return result
+
+# Returns p_n as the sum of m*c_o over the distinct w-oceans o of S_n, where m is the
+# number of permutations with w-ocean o
+# The w-oceans and their multiplicities come from ocean_shapes, not from a sweep
+# of S_n, and c_o is computed once per w-ocean
+def p5(n):
+    result = 0
+    for (d,m) in ocean_shapes(n):
+        result += m*c(None,d)
     return result
 
 # Test functions that time how long it takes to compute p_n
@@ -977,27 +2016,604 @@ def test_p4(n):
         end = time.time()
         print('p_' + str(i) + ' = '  + str(result) + '\t time elapsed: ' + str(end - start) + ' seconds')
 
+def test_p5(n):
+    for i in range(1,n + 1):
+        start = time.time()
+        result = p5(i)
+        end = time.time()
+        print('p_' + str(i) + ' = '  + str(result) + '\t time elapsed: ' + str(end - start) + ' seconds\t agrees with p: ' + str(result == p(i)))
+
+# Test function that checks c against c_naive for every w in S_k, for k = 1, ..., n
+def test_c(n):
+    for k in range(1,n + 1):
+        start = time.time()
+        bad = [w for w in S_range(k) if c(w) != c_naive(w)]
+        end = time.time()
+        print('S_' + str(k) + ': ' + str(len(bad)) + ' mismatches\t time elapsed: ' + str(end - start) + ' seconds')
+
+# Test function that checks, for k = 1, ..., n, that every PDC in S_k given by
+# PDC_intervals is the whole Bruhat interval [min, max], using a BruhatGraph
+def test_PDC_intervals(n):
+    for k in range(1,n + 1):
+        start = time.time()
+        graph = BruhatGraph(k)
+        bad = [x for x in PDC_intervals(k) if graph.interval_size(perm_rank(x[2]),perm_rank(x[3])) != x[1]]
+        end = time.time()
+        print('S_' + str(k) + ': ' + str(len(bad)) + ' mismatches\t time elapsed: ' + str(end - start) + ' seconds')
+
+# Benchmark for the parallel sweeps: times p(n) with 1, 2, ..., max_workers worker
+# processes (by default one per core) and compares each result against the serial one
+def test_p_parallel(n,max_workers=None):
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    start = time.time()
+    expected = p(n)
+    serial = time.time() - start
+    print('p_' + str(n) + ' = ' + str(expected) + '\t serial: ' + str(serial) + ' seconds')
+    for k in range(1,max_workers + 1):
+        start = time.time()
+        result = p(n,workers=k)
+        end = time.time()
+        print(str(k) + ' workers: ' + str(end - start) + ' seconds\t speedup: ' + str(serial/(end - start)) + '\t identical: ' + str(result == expected))
+
+
+##################
+# PDC CATALOGUES #
+##################
+
+
+# A catalogue is a binary file listing the PDC in S_n, sorted as in
+# PDC_intervals_S(n): a header (magic, n, number of records), followed by one
+# fixed-width record (rank, size, rank of min, rank of max) for each PDC, with the
+# minimal and maximal elements stored by their ranks (see perm_rank)
+# Sizes and ranks of permutations are stored as unsigned 64 bit integers, so
+# catalogues are for n <= 20
+CATALOGUE_MAGIC = b'PDCc'
+CATALOGUE_HEADER = struct.Struct('<4sBxxxQ')
+CATALOGUE_RECORD = struct.Struct('<HQQQ')
+
+# Computes the PDC in S_n whose minimal elements have rank in [start, stop) and
+# writes them to a catalogue file as they are produced
+# Returns the file name (by default Intervals_S_n.pdc)
+# If checkpoint is given, the minimal elements are swept step ranks at a time (by
+# default CHECKPOINT_STEP), the sorted records of each step are kept in a run file
+# next to the checkpoint file, and the next rank and the list of run files are
+# saved to it after each step (see resumable), so an interrupted run resumes from
+# the last step. The runs are merged into the catalogue at the end, and then
+# removed together with the checkpoint file
+def write_catalogue(n,filename=None,start=0,stop=None,buffer_size=None,checkpoint=None,step=None):
+    if filename is None:
+        filename = 'Intervals_S_' + str(n) + '.pdc'
+    if buffer_size is None:
+        buffer_size = SORT_BUFFER
+    if checkpoint is not None:
+        return resumable_catalogue(n,filename,checkpoint,start,stop,buffer_size,step)
+    count = 0
+    with open(filename,'wb') as f:
+        f.write(CATALOGUE_HEADER.pack(CATALOGUE_MAGIC,n,0))
+        for (r,size,w,y) in sorted_PDC_intervals(n,start,stop,buffer_size):
+            f.write(CATALOGUE_RECORD.pack(r,size,perm_rank(w),perm_rank(y)))
+            count += 1
+        # the number of records is only filled in once they are all written
+        f.seek(0)
+        f.write(CATALOGUE_HEADER.pack(CATALOGUE_MAGIC,n,count))
+    return filename
+
+# Writes the catalogue of write_catalogue(n, filename, start, stop, buffer_size)
+# step by step, saving its progress to the given checkpoint file
+# Since perm_rank is the rank in lexicographic order, the records of the runs sort
+# in the same order as the 4-tuples of sorted_PDC_intervals, so merging the runs
+# gives the same catalogue as an uninterrupted write_catalogue
+# Run files of the checkpoint that it does not list (left over when a run was
+# interrupted between writing a run, or merging runs, and saving the checkpoint)
+# are removed when the run resumes
+def resumable_catalogue(n,filename,checkpoint,start,stop,buffer_size,step=None):
+    N = math.factorial(n)
+    if stop is None or stop > N:
+        stop = N
+    if step is None:
+        step = CHECKPOINT_STEP
+    state = load_checkpoint(checkpoint)
+    sweep = ('write_catalogue',n,start,stop)
+    if state is None:
+        state = {'sweep': sweep, 'next': start, 'runs': []}
+    elif state['sweep'] != sweep:
+        raise ValueError(checkpoint + ' is a checkpoint of a different sweep: ' + str(state['sweep']))
+    for x in run_files(checkpoint):
+        if x not in state['runs']:
+            os.remove(x)
+    while state['next'] < stop:
+        a = state['next']
+        b = min(a + step,stop)
+        # a run left over by an interrupted step is simply written again
+        run = checkpoint + '.' + str(a)
+        write_records(run,(CATALOGUE_RECORD.pack(r,size,perm_rank(w),perm_rank(y))
+                           for (r,size,w,y) in sorted_PDC_intervals(n,a,b,buffer_size)))
+        state['runs'].append(run)
+        state['next'] = b
+        if len(state['runs']) == MERGE_WIDTH:
+            merged = checkpoint + '.merged.' + str(b)
+            write_records(merged,merge_records(state['runs']))
+            (old,state['runs']) = (state['runs'],[merged])
+            save_checkpoint(checkpoint,state)
+            for x in old:
+                os.remove(x)
+        else:
+            save_checkpoint(checkpoint,state)
+    count = 0
+    with open(filename,'wb') as f:
+        f.write(CATALOGUE_HEADER.pack(CATALOGUE_MAGIC,n,0))
+        for x in merge_records(state['runs']):
+            f.write(x)
+            count += 1
+        f.seek(0)
+        f.write(CATALOGUE_HEADER.pack(CATALOGUE_MAGIC,n,count))
+    for x in state['runs']:
+        os.remove(x)
+    os.remove(checkpoint)
+    return filename
+
+# Returns the list of the run files of resumable_catalogue with the given
+# checkpoint file: those named checkpoint.r or checkpoint.merged.r for a rank r
+def run_files(checkpoint):
+    directory = os.path.dirname(os.path.abspath(checkpoint))
+    prefix = os.path.basename(checkpoint) + '.'
+    result = []
+    for x in os.listdir(directory):
+        if x.startswith(prefix):
+            suffix = x[len(prefix):]
+            if suffix.startswith('merged.'):
+                suffix = suffix[len('merged.'):]
+            if suffix.isdigit():
+                result.append(os.path.join(os.path.dirname(checkpoint),x))
+    return result
+
+# Writes the packed catalogue records of the given iterable to a file, and makes
+# sure they are on disk before returning
+def write_records(filename,records):
+    with open(filename,'wb') as f:
+        for x in records:
+            f.write(x)
+        f.flush()
+        os.fsync(f.fileno())
+
+# Yields the packed catalogue records of the given files (each sorted) in sorted
+# order
+def merge_records(filenames):
+    yield from heapq.merge(*[read_records(x) for x in filenames],key=CATALOGUE_RECORD.unpack)
+
+# Yields the packed catalogue records of the given file, one after another
+def read_records(filename):
+    with open(filename,'rb') as f:
+        while True:
+            block = f.read(CATALOGUE_RECORD.size*4096)
+            if not block:
+                return
+            for i in range(0,len(block),CATALOGUE_RECORD.size):
+                yield block[i:i + CATALOGUE_RECORD.size]
+
+# A catalogue written by write_catalogue, memory-mapped, so that it is read from
+# disk only as its records are accessed
+# Indexing and iterating give 4-tuples (rank, size, min, max) as in PDC_intervals_S,
+# and the records are sorted by rank, so records of a given rank are found by
+# binary search
+class Catalogue:
+    def __init__(self,filename):
+        self.file = open(filename,'rb')
+        self.data = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        (magic,self.n,self.count) = CATALOGUE_HEADER.unpack_from(self.data,0)
+        if magic != CATALOGUE_MAGIC:
+            self.close()
+            raise ValueError(filename + ' is not a PDC catalogue')
+
+    def __repr__(self):
+        return 'catalogue of ' + str(self.count) + ' PDC in S_' + str(self.n)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # Returns the ith record as stored, (rank, size, rank of min, rank of max)
+    def record(self,i):
+        return CATALOGUE_RECORD.unpack_from(self.data,CATALOGUE_HEADER.size + i*CATALOGUE_RECORD.size)
+
+    def __getitem__(self,i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('catalogue index out of range')
+        (r,size,x,y) = self.record(i)
+        return (r,size,perm_unrank(x,self.n),perm_unrank(y,self.n))
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    # Returns the range of indices of the records of rank r
+    def rank_range(self,r):
+        ranks = RecordField(self,0)
+        return range(bisect.bisect_left(ranks,r),bisect.bisect_right(ranks,r))
+
+    # Yields the 4-tuples of the PDC with the given rank, size and minimal element
+    # (a permutation), where any of these left as None is not filtered on
+    # With NumPy, the size and minimal element are filtered with boolean masks over
+    # the mapped records, and only the matching records are unpacked
+    def select(self,rank=None,size=None,min=None):
+        indices = range(self.count) if rank is None else self.rank_range(rank)
+        x = None if min is None else perm_rank(min)
+        numpy = get_numpy()
+        if numpy is not None and (size is not None or x is not None):
+            records = self.records(numpy)[indices.start:indices.stop]
+            mask = numpy.ones(len(records),dtype=bool)
+            if size is not None:
+                mask &= records['size'] == size
+            if x is not None:
+                mask &= records['min'] == x
+            indices = (numpy.flatnonzero(mask) + indices.start).tolist()
+            del records
+        for i in indices:
+            (r,s,y,z) = self.record(i)
+            if (size is None or s == size) and (x is None or y == x):
+                yield (r,s,perm_unrank(y,self.n),perm_unrank(z,self.n))
+
+    # Returns the records as a NumPy structured array with fields rank, size, min and
+    # max, viewing the mapped file without copying it (the view must be deleted
+    # before the catalogue is closed)
+    def records(self,numpy):
+        dtype = numpy.dtype([('rank','<u2'),('size','<u8'),('min','<u8'),('max','<u8')])
+        return numpy.frombuffer(self.data,dtype=dtype,count=self.count,offset=CATALOGUE_HEADER.size)
+
+    # Returns the dict counting the records of each rank, in increasing order of rank
+    def rank_histogram(self):
+        return self.histogram(0)
+
+    # Returns the dict counting the records of each size, in increasing order of size
+    def size_histogram(self):
+        return self.histogram(1)
+
+    # Returns the dict counting the records with each value of the given field
+    # With NumPy, the whole field is counted at once from the mapped file
+    def histogram(self,field):
+        numpy = get_numpy()
+        if numpy is not None:
+            records = self.records(numpy)
+            (values,counts) = numpy.unique(records[records.dtype.names[field]],return_counts=True)
+            del records
+            return {int(x): int(y) for (x,y) in zip(values,counts)}
+        result = {}
+        for x in RecordField(self,field):
+            if x in result:
+                result[x] += 1
+            else:
+                result[x] = 1
+        return {x: result[x] for x in sorted(result)}
+
+# A read-only sequence view of one field of every record of a catalogue
+# (e.g. for binary search on the ranks)
+class RecordField:
+    def __init__(self,catalogue,field):
+        self.catalogue = catalogue
+        self.field = field
+
+    def __len__(self):
+        return self.catalogue.count
+
+    def __getitem__(self,i):
+        if not 0 <= i < self.catalogue.count:
+            raise IndexError('catalogue index out of range')
+        return self.catalogue.record(i)[self.field]
+
+
+####################
+# PERSISTENT CACHE #
+####################
+
+
+# Number of w-oceans looked up in (and written to) an OceanCache at a time
+CACHE_BATCH = 500
+
+# A cache of c_w on disk, keyed by (n, w-ocean), so that values computed in one run
+# (or by an aborted run, or by another worker process) are reused by the next
+# The cache is a SQLite database in write-ahead-logging mode, so worker processes
+# can read it while another one writes. Keys are SHA-1 hashes of the canonical
+# form repr((n, ocean)) of the w-ocean, and values are stored as decimal strings,
+# since c_w is unbounded
+# If max_entries is given, the least recently used entries are deleted whenever
+# there are more than that many. The number of entries is kept in the table meta
+# and updated in the same transaction as the entries, so that all the processes
+# writing to the cache see the same count
+# sqlite3 and hashlib are only imported when the first cache is opened, so that
+# importing PDC stays cheap
+class OceanCache:
+    def __init__(self,filename,max_entries=None):
+        import sqlite3
+        import hashlib
+        self.sha1 = hashlib.sha1
+        self.filename = filename
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(filename,timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS c (key BLOB PRIMARY KEY, n INTEGER, value TEXT, used INTEGER)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        if self.db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone() is None:
+            self.db.execute("INSERT OR IGNORE INTO meta SELECT 'size', COUNT(*) FROM c")
+        self.db.commit()
+        self.used = dict() # key -> time of the hits not yet written back
+
+    def __repr__(self):
+        return 'cache of c_w in ' + self.filename
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM c').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    # Writes the used stamps of the hits remembered by get_many back to the cache
+    def flush(self):
+        if self.used:
+            self.db.executemany('UPDATE c SET used = ? WHERE key = ?',[(t,k) for (k,t) in self.used.items()])
+            self.db.commit()
+            self.used.clear()
+
+    # Returns the key of the w-ocean o of a permutation in S_n
+    def key(self,n,o):
+        return self.sha1(repr((n,o)).encode()).digest()
+
+    # Returns the dict mapping those of the given w-oceans in S_n that are in the
+    # cache to their c_w; with max_entries set their hits are remembered and written
+    # back CACHE_BATCH at a time (or by put_many or close), so that most reads do
+    # not take the write lock
+    def get_many(self,n,oceans):
+        keys = dict()
+        for o in oceans:
+            keys[self.key(n,o)] = o
+        result = dict()
+        found = list(keys)
+        for i in range(0,len(found),CACHE_BATCH):
+            part = found[i:i + CACHE_BATCH]
+            query = 'SELECT key, value FROM c WHERE key IN (' + ','.join('?'*len(part)) + ')'
+            for (k,x) in self.db.execute(query,part):
+                result[keys[k]] = int(x)
+        if result and self.max_entries is not None:
+            now = time.time_ns()
+            for o in result:
+                self.used[self.key(n,o)] = now
+            if len(self.used) >= CACHE_BATCH:
+                self.flush()
+        return result
+
+    # Stores the c_w of the w-oceans in S_n given by the dict values (ocean -> c_w)
+    def put_many(self,n,values):
+        now = time.time_ns()
+        rows = [(self.key(n,o),n,str(x),now) for (o,x) in values.items()]
+        # c_w never changes, so a key already present only needs its used stamp
+        # (the insert takes the write lock, so the count read below is current)
+        added = self.db.executemany('INSERT OR IGNORE INTO c VALUES (?, ?, ?, ?)',rows).rowcount
+        self.db.execute("UPDATE meta SET value = value + ? WHERE name = 'size'",(added,))
+        if self.max_entries is not None:
+            for (k,_,_,_) in rows:
+                self.used[k] = now
+            self.db.executemany('UPDATE c SET used = ? WHERE key = ?',[(t,k) for (k,t) in self.used.items()])
+            self.used.clear()
+            size = self.db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+            excess = size - self.max_entries
+            if excess > 0:
+                removed = self.db.execute('DELETE FROM c WHERE key IN (SELECT key FROM c ORDER BY used LIMIT ?)',(excess,)).rowcount
+                self.db.execute("UPDATE meta SET value = value - ? WHERE name = 'size'",(removed,))
+        self.db.commit()
+
+    # Returns c_w for the w-ocean o of a permutation in S_n, or None if it is not cached
+    def get(self,n,o):
+        return self.get_many(n,[o]).get(o)
+
+    # Stores c_w = x for the w-ocean o of a permutation in S_n
+    def put(self,n,o,x):
+        self.put_many(n,{o: x})
+
+# Returns the sum of k*c_w over the pairs (d, k) of an OceanDescriptor d of a
+# permutation w in S_n and a weight k, where c_w is looked up by w-ocean in the given
+# OceanCache (or the cache with the given file name, or (file name, max_entries)
+# as handed to worker processes by shared_cache), CACHE_BATCH w-oceans at a time,
+# and the values that had to be computed are stored in it
+def cached_sum(n,weighted,cache):
+    if not isinstance(cache,OceanCache):
+        if not isinstance(cache,tuple):
+            cache = (cache,)
+        with OceanCache(*cache) as x:
+            return cached_sum(n,weighted,x)
+    OCEANS = dict() # c_w of the w-oceans already looked up
+    pending = dict() # w-ocean -> [descriptor, total weight], for the next batch
+    result = 0
+    for (d,k) in weighted:
+        o = d.ocean()
+        if o in OCEANS:
+            result += k*OCEANS[o]
+        elif o in pending:
+            pending[o][1] += k
+        else:
+            pending[o] = [d,k]
+            if len(pending) == CACHE_BATCH:
+                result += resolve_pending(n,pending,OCEANS,cache)
+    return result + resolve_pending(n,pending,OCEANS,cache)
+
+# Returns the given cache (an OceanCache or a file name) in a form that can be
+# handed to worker processes, which open it themselves: an OceanCache, whose
+# connection cannot be pickled, is replaced by its file name and max_entries
+def shared_cache(cache):
+    if isinstance(cache,OceanCache):
+        cache.flush()
+        return (cache.filename,cache.max_entries)
+    return cache
+
+# Helper function for cached_sum: looks up the pending w-oceans in the cache,
+# computes and stores the missing ones, moves them all to OCEANS and returns
+# the sum of their weighted c_w
+def resolve_pending(n,pending,OCEANS,cache):
+    known = cache.get_many(n,pending)
+    new = dict()
+    result = 0
+    for (o,(d,k)) in pending.items():
+        if o in known:
+            x = known[o]
+        else:
+            x = new[o] = c(d.w,d)
+        OCEANS[o] = x
+        result += k*x
+    if new:
+        cache.put_many(n,new)
+    pending.clear()
+    return result
+
 
 #########
 # Misc. #
 #########
 
 
-# Returns the set of all parabolic double cosets in S_n
+# Number of intervals sorted in memory at a time by sorted_PDC_intervals, and the
+# number of sorted runs it merges at once (so as to keep few files open)
+SORT_BUFFER = 1000000
+MERGE_WIDTH = 64
+
+# Yields every parabolic double coset in S_n whose minimal element has rank in
+# [start, stop), exactly once, as a 4-tuple (rank, size, min, max)
+# A PDC with minimal element w has many presentations W_IwW_J with I contained in
+# Asc_L(w) and J in Asc_R(w), but only one with I = Asc_L(w) \cap Des_L(max) and
+# J = Asc_R(w) \cap Des_R(max) (the largest one, as in presentation), so only that
+# one is yielded, and no set of the intervals seen so far is needed
+# The block layouts of the submasks I and J, and wJw^{-1} for each J, are computed
+# once per w. The rank and size are only computed for the canonical presentations,
+# from H = I \cap wJw^{-1}: the rank is l(w_0(I)) + l(w_0(J)) - l(w_0(H)) and the
+# size |W_I||W_J|/|W_H|
+# A sweep of all of S_n goes in Steinhaus-Johnson-Trotter order (see sjt_S)
+def PDC_intervals(n,start=0,stop=None):
+    if start == 0 and (stop is None or stop >= math.factorial(n)):
+        sweep = (d for (d,l) in sjt_S(n))
+    else:
+        sweep = descriptors_S(n,start,stop)
+    for d in sweep:
+        w = d.w
+        Is = [(I,block_layout(I,n)) for I in submasks(d.leftAscents)]
+        for J in submasks(d.rightAscents):
+            layout = block_layout(J,n)
+            conj = conjugate_mask(w,J)
+            for (I,left) in Is:
+                y = sortRight(sortLeft(w,left,True),layout,True)
+                (leftDescents,rightDescents) = descentMasks(y)
+                if I == d.leftAscents & leftDescents and J == d.rightAscents & rightDescents:
+                    H = I & conj
+                    yield (length_W(I) + length_W(J) - length_W(H),card_W(I)*card_W(J) // card_W(H),w,y)
+
+# Yields the 4-tuples of PDC_intervals(n,start,stop) in sorted order (by rank, then
+# size, min and max)
+# At most buffer_size intervals are held in memory: each run of that many is sorted
+# and written to a temporary file, and the runs are then merged (MERGE_WIDTH at
+# a time, into a single run, whenever there are that many)
+def sorted_PDC_intervals(n,start=0,stop=None,buffer_size=SORT_BUFFER):
+    runs = []
+    try:
+        intervals = PDC_intervals(n,start,stop)
+        while True:
+            run = []
+            for x in intervals:
+                run.append(x)
+                if len(run) == buffer_size:
+                    break
+            run.sort()
+            if len(run) < buffer_size and not runs:
+                yield from run # everything fits in memory
+                return
+            runs.append(write_run(run))
+            if len(runs) == MERGE_WIDTH:
+                merged = write_run(heapq.merge(*[read_run(f) for f in runs]))
+                for f in runs:
+                    f.close()
+                runs = [merged]
+            if len(run) < buffer_size:
+                break
+        yield from heapq.merge(*[read_run(f) for f in runs])
+    finally:
+        for f in runs:
+            f.close()
+
+# Pickles the objects of the given iterable one after another into a temporary
+# file, and returns the file, rewound
+def write_run(run):
+    f = tempfile.TemporaryFile()
+    for x in run:
+        pickle.dump(x,f)
+    f.seek(0)
+    return f
+
+# Yields the objects pickled one after another in the file f
+def read_run(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+# Returns the joint distribution of rank and size over the PDC in S_n whose
+# minimal elements have rank in [start, stop), as a Counter mapping (rank, size)
+# to the number of such PDC
+# The PDC are counted as they are generated, so only the distinct pairs
+# (rank, size) are held in memory. With workers, the sweep is sharded across
+# that many processes and the Counters of the shards are added up
+# If checkpoint is given, the sweep saves its progress to that file (see resumable)
+def rank_size_distribution(n,start=0,stop=None,workers=None,checkpoint=None):
+    if checkpoint is not None:
+        return resumable(rank_size_distribution,n,checkpoint,start,stop,workers)
+    result = Counter()
+    if workers is not None:
+        for x in sharded(rank_size_distribution,n,start,stop,workers):
+            result.update(x)
+        return result
+    for x in PDC_intervals(n,start,stop):
+        result[(x[0],x[1])] += 1
+    return result
+
+# Returns the bivariate generating polynomial sum q^rank t^size over the PDC in S_n
+# (as in rank_size_distribution), as a string, e.g. '2t + q t^2' for n = 2
+def rank_size_polynomial(n,start=0,stop=None,workers=None):
+    distribution = rank_size_distribution(n,start,stop,workers)
+    terms = []
+    for (r,size) in sorted(distribution):
+        k = distribution[(r,size)]
+        monomial = []
+        if r > 0:
+            monomial.append('q' if r == 1 else 'q^' + str(r))
+        if size > 1:
+            monomial.append('t^' + str(size))
+        else:
+            monomial.append('t')
+        term = ' '.join(monomial)
+        if k > 1:
+            term = str(k) + term
+        terms.append(term)
+    return ' + '.join(terms)
+
+# Returns the list of all parabolic double cosets in S_n
 # represented as 4-tuples (rank, size, min, max)
 # The returned list is sorted by rank, then size
 def PDC_intervals_S(n):
-    if n != N:
-        set_N(n)
-    result = set()
-    for w in S(n):
-        for I in powerset(leftAscentSet(w)):
-            for J in powerset(rightAscentSet(w)):
-                y = maximal(I,w,J)
-                result.add((length(y) - length(w),card(I,w,J),w,y))
-    result = list(result)
-    result.sort()
-    return result
+    return list(sorted_PDC_intervals(n))
 
 # Returns the hamming distance of the given indexed structures
 def hamming(a,b):
@@ -1012,10 +2628,17 @@ def hamming(a,b):
 
 # Returns a crude estimate of p_n based on a random sample
 # (with replacement) of k permutations
-def rand_p(n,k):
-    if n != N:
-        set_N(n)
+# If workers is given, the sample is drawn exactly as in the serial case and
+# then split across that many worker processes, giving the same estimate
+def rand_p(n,k,workers=None):
     result = 0
+    if workers is not None:
+        ranks = [random.randrange(math.factorial(n)) for i in range(k)]
+        parts = [ranks[k*i // workers:k*(i + 1) // workers] for i in range(workers)]
+        with WorkerPool(workers) as pool:
+            for x in pool.map(c_sum,[n]*workers,parts):
+                result += x
+        return round(result*(math.factorial(n)/k))
     for i in range(k):
         result += c(rand_w(n))
     return round(result*(math.factorial(n)/k))
@@ -1023,45 +2646,208 @@ def rand_p(n,k):
 # Returns a crude estimate of p_n based on a random sample
 # (without replacement) of k permutations
 def rand_p2(n,k):
-    if n != N:
-        set_N(n)
     result = 0
-    for w in random.sample(S(n),k):
-        result += c(w)
+    for r in random.sample(range(math.factorial(n)),k):
+        result += c(perm_unrank(r,n))
     return round(result*(math.factorial(n)/k))
 
 # Returns a random permutation in S_n
 def rand_w(n):
-        s = set(range(1,n+1))
-        result = []
-        for i in range(n):
-            x = random.sample(s,1)[0]
-            s.remove(x)
-            result.append(x)
-        return tuple(result)
+    return perm_unrank(random.randrange(math.factorial(n)),n)
 
 # Returns the set of all Bruhat intervals in S_n
 # as a set of tuples (a, b)
+# Each up-set is found by a search along the covering relations, so the work is
+# proportional to the number of intervals rather than to (n!)^2
 def intervals_S(n):
-    Z = S(n)
     result = set()
-    for x in Z:
-        for y in Z:
-            if le_bruhat(x,y):
-                result.add((x,y))
+    perms = list(S_range(n))
+    graph = BruhatGraph(n)
+    for x in range(len(perms)):
+        for y in graph.upset(x):
+            result.add((perms[x],perms[y]))
     return result
 
+# Yields the permutations covering w in Bruhat order, i.e. w*t for the transpositions
+# t of the positions i < j with w(i) < w(j) and no w(k) in between for i < k < j
+def covers(w):
+    n = len(w)
+    for i in range(n - 1):
+        m = n + 1 # smallest value greater than w(i) seen so far
+        for j in range(i + 1,n):
+            if w[i] < w[j] < m:
+                z = list(w)
+                z[i] = w[j]
+                z[j] = w[i]
+                yield tuple(z)
+                m = w[j]
+
+# The Hasse diagram of Bruhat order on S_n, over the ranks of permutations
+# (see perm_rank), stored in compressed sparse row form: the ranks of the
+# permutations covering the permutation of rank r are
+# up[upOffsets[r]:upOffsets[r + 1]], and those it covers are
+# down[downOffsets[r]:downOffsets[r + 1]]
+# Bruhat order is graded by length, so searches along the covers go one length at a
+# time and only keep the current level in memory
+class BruhatGraph:
+    def __init__(self,n):
+        self.n = n
+        self.N = math.factorial(n)
+        code = 'I' if self.N <= 1 << 32 else 'Q'
+        self.upOffsets = array('Q',[0])
+        self.up = array(code)
+        for w in S_range(n):
+            for z in covers(w):
+                self.up.append(perm_rank(z))
+            self.upOffsets.append(len(self.up))
+        # the down edges are the up edges reversed, sorted by their source
+        counts = [0]*(self.N + 1)
+        for y in self.up:
+            counts[y + 1] += 1
+        for r in range(self.N):
+            counts[r + 1] += counts[r]
+        self.downOffsets = array('Q',counts)
+        self.down = array(code,bytes(len(self.up)*self.up.itemsize))
+        fill = counts[:-1]
+        for x in range(self.N):
+            for i in range(self.upOffsets[x],self.upOffsets[x + 1]):
+                y = self.up[i]
+                self.down[fill[y]] = x
+                fill[y] += 1
+
+    def __repr__(self):
+        return 'Bruhat graph of S_' + str(self.n) + ' with ' + str(len(self.up)) + ' edges'
+
+    # Returns the ranks of the permutations covering the permutation of rank r
+    def covers(self,r):
+        return self.up[self.upOffsets[r]:self.upOffsets[r + 1]]
+
+    # Returns the ranks of the permutations covered by the permutation of rank r
+    def cocovers(self,r):
+        return self.down[self.downOffsets[r]:self.downOffsets[r + 1]]
+
+    # Yields the ranks of the permutations reachable from r through the given
+    # edges, one level (length) at a time, starting with r itself
+    # Only those of rank in keep (if given) are yielded and searched from
+    def search(self,r,offsets,edges,keep=None):
+        level = [r]
+        while level:
+            yield from level
+            nextLevel = set()
+            for x in level:
+                for i in range(offsets[x],offsets[x + 1]):
+                    nextLevel.add(edges[i])
+            if keep is not None:
+                nextLevel = [y for y in nextLevel if keep(y)]
+            level = sorted(nextLevel)
+
+    # Yields the ranks of the permutations >= the permutation of rank r, by length
+    def upset(self,r):
+        return self.search(r,self.upOffsets,self.up)
+
+    # Yields the ranks of the permutations <= the permutation of rank r, by length
+    def downset(self,r):
+        return self.search(r,self.downOffsets,self.down)
+
+    # Yields the ranks of the permutations in the Bruhat interval [x, y] (given by
+    # their ranks), by length
+    # Every element of [x, y] is on a chain of covers from x inside [x, y], so the
+    # search from x only continues from the permutations <= y
+    def interval(self,x,y):
+        w = perm_unrank(y,self.n)
+        if not le_bruhat(perm_unrank(x,self.n),w):
+            return iter(())
+        return self.search(x,self.upOffsets,self.up,lambda z: le_bruhat(perm_unrank(z,self.n),w))
+
+    # Returns the number of permutations in the Bruhat interval [x, y]
+    def interval_size(self,x,y):
+        result = 0
+        for z in self.interval(x,y):
+            result += 1
+        return result
+
+# Bruhat order is compared through rank matrices: x <= y if and only if
+# x[i,k] <= y[i,k] for all i, k, where w[i,k] is the number of j <= i with w(j) >= k
+# (this is the tableau criterion: the sorted prefixes of x are componentwise
+# at most those of y)
+
+# Returns the rank matrix of w, as the tuple of rows (w[i,1], ..., w[i,n])
+# for i = 1, ..., n - 1
+def rank_matrix(w):
+    n = len(w)
+    row = [0]*n
+    result = []
+    for i in range(n - 1):
+        for k in range(w[i]):
+            row[k] += 1
+        result.append(tuple(row))
+    return tuple(result)
+
 # Returns whether x <= y in Bruhat order
+# Keeps d[k] = y[i,k] - x[i,k] for the current prefix i, which only changes for
+# k between x(i) and y(i), and stops as soon as some d[k] is negative
 def le_bruhat(x,y):
-    for i in range(len(x) - 1):
-        a = list(x[:i + 1])
-        b = list(y[:i + 1])
-        a.sort()
-        b.sort()
-        if not le_indexed(a,b):
-            return False
+    n = len(x)
+    d = [0]*(n + 1)
+    for i in range(n - 1):
+        a = x[i]
+        b = y[i]
+        if a < b:
+            for k in range(a + 1,b + 1):
+                d[k] += 1
+        elif a > b:
+            for k in range(b + 1,a + 1):
+                d[k] -= 1
+                if d[k] < 0:
+                    return False
     return True
 
+# Returns the rank matrices of the given permutations (a list of permutations,
+# a PermArray or an (m, n) array) as an (m, n - 1, n) NumPy array, or without
+# NumPy as the list of their rank_matrix
+def rank_matrices(perms):
+    numpy = get_numpy()
+    if numpy is None:
+        return [rank_matrix(tuple(w)) for w in perms]
+    X = as_array(perms)
+    n = X.shape[1]
+    k = numpy.arange(1,n + 1)
+    return numpy.cumsum(X[:,:n - 1,None] >= k,axis=1,dtype=numpy.int8)
+
+# Batch form of le_bruhat: returns, for each of the given permutations x (a list of
+# permutations, a PermArray or an (m, n) array), whether x <= y in Bruhat order
+# With NumPy, all the rank matrices are compared with that of y at once and the
+# result is a boolean array; without it, a list
+def le_bruhat_batch(perms,y):
+    numpy = get_numpy()
+    if numpy is None:
+        return [le_bruhat(x,y) for x in perms]
+    if len(perms) == 0:
+        return numpy.zeros(0,dtype=bool)
+    return (rank_matrices(perms) <= rank_matrices([y])[0]).all(axis=(1,2))
+
+# Returns the comparison bitmap of S_n in Bruhat order, as a bytearray of n! rows of
+# ceil(n!/8) bytes, where bit s % 8 of byte s // 8 of row r is set iff x <= y for
+# the permutations x, y of ranks s, r
+def bruhat_bitmap(n):
+    N = math.factorial(n)
+    width = (N + 7) // 8
+    result = bytearray(N*width)
+    numpy = get_numpy()
+    if numpy is not None:
+        M = rank_matrices(list(S_range(n)))
+        for r in range(N):
+            row = (M <= M[r]).all(axis=(1,2))
+            result[r*width:(r + 1)*width] = numpy.packbits(row,bitorder='little').tobytes()
+        return result
+    # the rank matrices of S_n, flattened, are compared entry by entry
+    M = [sum(x,()) for x in rank_matrices(S_range(n))]
+    for r in range(N):
+        for s in range(N):
+            if le_indexed(M[s],M[r]):
+                result[r*width + s // 8] |= 1 << (s % 8)
+    return result
+
 # Given two indexed structures a and b, returns whether
 # a <= b componentwise
 def le_indexed(a,b):
@@ -1072,47 +2858,60 @@ def le_indexed(a,b):
 
 # Returns whether the given interval is a PDC
 def isPDC(x):
-    I = leftAscentSet(x[0]).intersection(leftDescentSet(x[1]))
-    J = rightAscentSet(x[0]).intersection(rightDescentSet(x[1]))
+    a = descriptor(x[0])
+    b = descriptor(x[1])
+    I = a.leftAscents & b.leftDescents
+    J = a.rightAscents & b.rightDescents
     return x[0] == minimal(I,x[1],J)
 
 # Returns |W_I|, the cardinality of the parabolic subgroup generated
-# by the given set I
+# by the given set (or mask) I
+# W_I is the product of the symmetric groups on the blocks of I
 def card_W(I):
-    if len(I) == 0:
-        return 1
-    resultList = list()
-    stack = list(I)
-    stack.sort()
-    stack.reverse()
-    counter = 1
-    prev = stack.pop()
-    while len(stack) > 0:
-        curr = stack.pop()
-        if curr == prev + 1:
-            counter += 1
-        else:
-            resultList.append(counter)
-            counter = 1
-        prev = curr
-    resultList.append(counter)
     result = 1
-    for z in resultList:
-        result *= math.factorial(z + 1)
+    for (a,b) in blocks(to_mask(I)):
+        result *= math.factorial(b - a + 2)
     return result
 
-def card_W2(I):
-    return len(parabolic_subgroup(I))
+# Returns the length of the longest element of W_I, for the set (or mask) I
+# (the longest element of the symmetric group on m letters has length m(m - 1)/2)
+def length_W(I):
+    result = 0
+    for (a,b) in blocks(to_mask(I)):
+        m = b - a + 2
+        result += m*(m - 1) // 2
+    return result
 
-# Returns H = I \cap (wJw^{-1})
+# Returns |W_I| by enumerating the elements of W_I (for testing card_W)
+def card_W2(I,n):
+    result = 0
+    for w in ParabolicSubgroup(I,n):
+        result += 1
+    return result
+
+# Returns the mask of the simple reflections in wJw^{-1}, read off from the
+# positions of w: w*s_j*w^{-1} is the transposition of the values w(j) and w(j + 1),
+# which is the simple reflection s_i for i = min(w(j), w(j + 1)) if these values
+# differ by 1
+def conjugate_mask(w,J):
+    result = 0
+    m = to_mask(J)
+    while m:
+        low = m & -m
+        j = low.bit_length() - 1
+        x = w[j - 1]
+        y = w[j]
+        if x - y == 1 or y - x == 1:
+            result |= 1 << min(x,y)
+        m ^= low
+    return result
+
+# Returns H = I \cap (wJw^{-1}), as a mask if I and J are masks
 def H(I,w,J):
-    result1 = set()
-    result2 = set()
-    for i in I:
-        result1.add(s(i))
-    for j in J:
-        result2.add(mult(w,mult(s(j),inverse(w))))
-    return simple(result1.intersection(result2))
+    result = to_mask(I) & conjugate_mask(w,J)
+    if isinstance(I,int) and isinstance(J,int):
+        return result
+    return to_set(result)
 
 # Given a set of adjacent transpositions X (represented as tuples),
 # returns the set {i : s_i in X}
@@ -1127,9 +2926,46 @@ def simple(X):
     return result
 
 # Returns |W_IwW_J|, the cardinality of the parabolic double
-# coset W_IwW_J
+# coset W_IwW_J, as an exact integer
+# This is |W_I||W_J|/|W_H| for H = I \cap (wJw^{-1}) when w is the minimal element,
+# so w is first replaced by the minimal element
 def card(I,w,J):
-    return int(card_W(I) * card_W(J) / card_W(H(I,w,J)))
+    I = to_mask(I)
+    J = to_mask(J)
+    w = minimal(I,w,J)
+    return card_W(I) * card_W(J) // card_W(I & conjugate_mask(w,J))
+
+# Batch form of card: returns the dict mapping each pair (I,J) of masks, with I a
+# submask of Imask and J a submask of Jmask, to |W_IwW_J|
+# Imask and Jmask default to the left and right ascent sets of w, and must be
+# contained in them, so that w is the minimal element of every W_IwW_J
+# wJw^{-1} is built up one bit of J at a time, and |W_X| is computed once for each X
+def card_batch(w,Imask=None,Jmask=None):
+    d = descriptor(w)
+    if Imask is None:
+        Imask = d.leftAscents
+    if Jmask is None:
+        Jmask = d.rightAscents
+    Is = list(submasks(Imask))
+    Js = list(submasks(Jmask))
+    Js.reverse() # so that J & (J - 1) always comes before J
+    conj = {0: 0}
+    for J in Js[1:]:
+        low = J & -J
+        conj[J] = conj[J ^ low] | conjugate_mask(w,low)
+    sizes = dict()
+    for X in Is + Js:
+        if X not in sizes:
+            sizes[X] = card_W(X)
+    result = dict()
+    for J in Js:
+        x = sizes[J]
+        for I in Is:
+            K = I & conj[J]
+            if K not in sizes:
+                sizes[K] = card_W(K)
+            result[(I,J)] = sizes[I] * x // sizes[K]
+    return result
 
 # Given a PDC in interval form (a, b), returns a presentation
 # (I,w,J) such that a = min W_IwW_J and b = max W_IwW_J
@@ -1137,51 +2973,57 @@ def presentation(x):
     if not isPDC(x):
         print("The given interval is not a PDC.")
         return None
+    a = descriptor(x[0])
+    b = descriptor(x[1])
     result = [0, 0, 0]
-    result[0] = tuple(leftAscentSet(x[0]).intersection(leftDescentSet(x[1])))
+    result[0] = to_indices(a.leftAscents & b.leftDescents)
     result[1] = x[1]
-    result[2] = tuple(rightAscentSet(x[0]).intersection(rightDescentSet(x[1])))
+    result[2] = to_indices(a.rightAscents & b.rightDescents)
     return tuple(result)
 
 def write_intervals_S(n):
     f = open('Intervals_S_' + str(n) + '.txt','w')
     f.write('rank \t size \t min \t max\n\n')
-    for x in PDC_intervals_S(n):
+    for x in sorted_PDC_intervals(n):
         f.write(str(x) + '\n')
     f.close()
 
-def print_sizes_S(n):
-    sizeMap = {}
-    for x in PDC_intervals_S(n):
-        if x[1] in sizeMap:
-            sizeMap[x[1]] += 1
-        else:
-            sizeMap[x[1]] = 1
+# Returns the pair of dicts (rankMap, sizeMap) counting the PDC in S_n of each
+# rank and of each size, in increasing order of rank and size
+# If catalogue is given (a Catalogue or the file name of one, see write_catalogue),
+# the counts are read from it instead of enumerating the PDC again (it must be a
+# catalogue of S_n)
+# Otherwise they are the marginals of rank_size_distribution(n,workers=workers),
+# with its progress saved to the file checkpoint, if given
+def ranks_sizes_S(n,catalogue=None,workers=None,checkpoint=None):
+    if catalogue is not None:
+        if not isinstance(catalogue,Catalogue):
+            with Catalogue(catalogue) as c:
+                return ranks_sizes_S(n,c)
+        if catalogue.n != n:
+            raise ValueError('the catalogue is of S_' + str(catalogue.n) + ', not S_' + str(n))
+        return (catalogue.rank_histogram(),catalogue.size_histogram())
+    rankMap = Counter()
+    sizeMap = Counter()
+    for ((r,size),k) in rank_size_distribution(n,workers=workers,checkpoint=checkpoint).items():
+        rankMap[r] += k
+        sizeMap[size] += k
+    rankMap = {y: rankMap[y] for y in sorted(rankMap)}
+    sizeMap = {z: sizeMap[z] for z in sorted(sizeMap)}
+    return (rankMap,sizeMap)
+
+def print_sizes_S(n,catalogue=None,workers=None):
+    sizeMap = ranks_sizes_S(n,catalogue,workers)[1]
     for y in sizeMap:
         print(str(y) + ': ' + str(sizeMap[y]) + '\n')
 
-def print_ranks_S(n):
-    rankMap = {}
-    for x in PDC_intervals_S(n):
-        if x[0] in rankMap:
-            rankMap[x[0]] += 1
-        else:
-            rankMap[x[0]] = 1
+def print_ranks_S(n,catalogue=None,workers=None):
+    rankMap = ranks_sizes_S(n,catalogue,workers)[0]
     for y in rankMap:
         print(str(y) + ': ' + str(rankMap[y]) + '\n')
 
-def print_ranks_sizes_S(n):
-    rankMap = {}
-    sizeMap = {}
-    for x in PDC_intervals_S(n):
-        if x[0] in rankMap:
-            rankMap[x[0]] += 1
-        else:
-            rankMap[x[0]] = 1
-        if x[1] in sizeMap:
-            sizeMap[x[1]] += 1
-        else:
-            sizeMap[x[1]] = 1
+def print_ranks_sizes_S(n,catalogue=None,workers=None):
+    (rankMap,sizeMap) = ranks_sizes_S(n,catalogue,workers)
     print("Ranks:\n")
     for y in rankMap:
         print(str(y) + ': ' + str(rankMap[y]) + '\n')
@@ -1189,19 +3031,9 @@ def print_ranks_sizes_S(n):
     for z in sizeMap:
         print(str(z) + ': ' + str(sizeMap[z]) + '\n')
 
-def write_ranks_sizes_S(n):
+def write_ranks_sizes_S(n,catalogue=None,workers=None):
+    (rankMap,sizeMap) = ranks_sizes_S(n,catalogue,workers)
     f = open('ranks_and_sizes_S_' + str(n) +'.txt','w')
-    rankMap = {}
-    sizeMap = {}
-    for x in PDC_intervals_S(n):
-        if x[0] in rankMap:
-            rankMap[x[0]] += 1
-        else:
-            rankMap[x[0]] = 1
-        if x[1] in sizeMap:
-            sizeMap[x[1]] += 1
-        else:
-            sizeMap[x[1]] = 1
     f.write("Ranks:\n\n")
     for y in rankMap:
         f.write(str(y) + ': ' + str(rankMap[y]) + '\n')
@@ -1212,57 +3044,58 @@ def write_ranks_sizes_S(n):
 
 # Prints all PDC in S_n of rank binomial(n,2) - 1
 def print_intervals_1(n):
-    if n != N:
-        set_N(n)
+    G = SymmetricGroup(n)
     atoms = set()
     coatoms = set()
     for i in range(1,n):
-        atoms.add(s(i))
-        coatoms.add(mult(w0,s(i)))
+        atoms.add(G.s(i))
+        coatoms.add(mult(G.w0,G.s(i)))
     I = set()
     for a in atoms:
         for b in coatoms:
-            I.add((e,b))
-            I.add((a,w0))
+            I.add((G.e,b))
+            I.add((a,G.w0))
     for i in I:
         if isPDC(i):
             print(str(i) + ' ' + str(isPDC(i)) + '\n')
 
 # Prints all PDC in S_n of rank binomial(n,2) - 1                            
 def print_intervals_2(n):
-    if n != N:
-        set_N(n)
+    G = SymmetricGroup(n)
     atoms = set()
     coatoms = set()
     atoms2 = set()
     coatoms2 = set()
     for i in range(1,n):
-        atoms.add(s(i))
-        coatoms.add(mult(w0,s(i)))
+        atoms.add(G.s(i))
+        coatoms.add(mult(G.w0,G.s(i)))
         for j in range(1,n):
             if i != j:
-                m = mult(s(i),s(j))
+                m = mult(G.s(i),G.s(j))
                 atoms2.add(m)
-                coatoms2.add(mult(w0,m))
+                coatoms2.add(mult(G.w0,m))
     I = set()
     for a in atoms:
         for b in coatoms:
             I.add((a,b))
     for c in atoms2:
-        I.add((a,w0))
+        I.add((a,G.w0))
     for d in coatoms2:
-        I.add((e,d))
+        I.add((G.e,d))
     for i in I:
         if isPDC(i):
             print(str(i) + ' ' + str(isPDC(i)) + '\n')
 
-def u(i):
+def u(i,n):
+    s = SymmetricGroup(n).s
     return mult(s(i),mult(s(i-1),mult(s(i+1),s(i))))
 
-def v(i):
+def v(i,n):
+    s = SymmetricGroup(n).s
     return mult(s(i),mult(s(i+1),mult(s(i-1),mult(s(i),mult(s(i+2),s(i+1))))))
 
-def z(i):
+def z(i,n):
+    s = SymmetricGroup(n).s
     return mult(s(i),mult(s(i-1),mult(s(i+1),mult(s(i),mult(s(i+2),mult(s(i+1),mult(s(i-2),mult(s(i-1),s(i)))))))))
 
 # Prints ALL reduced expression for the given permutation w
@@ -1274,13 +3107,14 @@ def print_reduced(w):
 
 # Helper function for print_reduced(w)
 def print_reduced2(w,result,resultSet):
-    if w == e:
+    n = len(w)
+    if w == identity(n):
         resultSet.add(tuple(result[0] + result[1]))
     else:
         for i in leftDescentSet(w):
-            print_reduced2(mult(s(i),w), [result[0] + [i], result[1]], resultSet)
+            print_reduced2(mult(s(i,n),w), [result[0] + [i], result[1]], resultSet)
         for j in rightDescentSet(w):
-            print_reduced2(mult(w,s(j)), [result[0], [j] + result[1]], resultSet)
+            print_reduced2(mult(w,s(j,n)), [result[0], [j] + result[1]], resultSet)
 
 # Returns the set of all reduced expressions for w.
 # Reduced expressions are represented as lists,
@@ -1294,8 +3128,7 @@ def reduced(w):
 # every reduced expression for w_0 in S_n
 def counts(i,n):
     result = []
-    set_N(n)
-    for x in reduced(w0):
+    for x in reduced(longest(n)):
         result.append(x.count(i))
     return result
 